@@ -0,0 +1,149 @@
+"""
+Continuous export of activities and deliveries.
+
+>>> from bronto.activities import ActivityExport
+>>> export = ActivityExport(client, 'activities.state')
+>>> export.outbound('outbound.ndjson', types=['open', 'click', 'bounce'])
+>>> export.inbound(handle_inbound_activity)
+>>> export.deliveries('deliveries.ndjson')
+
+Every stream keeps a cursor in the state file: the newest date it has
+exported, and which records at that date were already written. The next run
+reads from that date on and skips those records, so older windows are never
+read again. Records are written as they are read, keeping memory use
+bounded, and the cursor is saved every ``save_every`` records and when the
+export stops, even on an error, so an interrupted export picks up about
+where it stopped. Records come in date order, which the cursor relies on;
+the rare record without a date is written every time it is read.
+
+Export is at least once: if the process is killed, the records written
+since the cursor was last saved are exported again by the next run.
+"""
+import io
+import json
+import os
+from datetime import datetime, timedelta
+
+from bronto.utils import format_date, write_atomic
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def compact(record):
+    """
+    Turn a suds object into a dict of its non empty values, with dates as
+    strings.
+    """
+    from suds.sudsobject import Object, asdict
+    if isinstance(record, Object):
+        return dict((key, compact(value))
+                    for key, value in asdict(record).items()
+                    if value is not None and value != [])
+    if isinstance(record, list):
+        return [compact(x) for x in record]
+    if hasattr(record, 'strftime'):
+        return format_date(record)
+    return record
+
+
+class ActivityExport(object):
+    """
+    ``since`` is how far back the first run of a stream starts; Bronto only
+    keeps recent activities for 7 days.
+    """
+
+    def __init__(self, client, state_path, since=timedelta(days=1),
+                 save_every=1000):
+        self.client = client
+        self.state_path = state_path
+        self.since = since
+        self.save_every = save_every
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as handle:
+            return json.load(handle)
+
+    def _save_cursor(self, stream, cursor):
+        state = self._load_state()
+        state[stream] = cursor
+        write_atomic(self.state_path, json.dumps(state, sort_keys=True))
+
+    def _export(self, stream, read, date_attribute, sink):
+        cursor = self._load_state().get(stream)
+        if cursor is None:
+            start = datetime.utcnow() - self.since
+            cursor = {'date': start.strftime(DATE_FORMAT), 'seen': []}
+        start = datetime.strptime(cursor['date'], DATE_FORMAT)
+        newest = cursor['date']
+        seen = set(cursor['seen'])
+        if callable(sink):
+            write, output = sink, None
+        else:
+            output = io.open(sink, 'a', encoding='utf-8')
+            write = lambda record: output.write(
+                u'%s\n' % json.dumps(record, sort_keys=True))
+        count = 0
+
+        def save():
+            # The cursor must never get ahead of what was written.
+            if output is not None:
+                output.flush()
+            self._save_cursor(stream, {'date': newest, 'seen': sorted(seen)})
+
+        try:
+            # Deliveries are read strictly after the given date: start a
+            # second early so the cursor's own second is read again, the
+            # records already exported at it being skipped through ``seen``.
+            for record in read(start - timedelta(seconds=1)):
+                record = compact(record)
+                date = (record.get(date_attribute) or '')[:19]
+                key = json.dumps(record, sort_keys=True)
+                if not date:
+                    # Can't be placed on the cursor: written every time it
+                    # is read rather than dropped.
+                    write(record)
+                    count += 1
+                    continue
+                if date < cursor['date'] or (date == cursor['date'] and
+                                             key in seen):
+                    continue
+                write(record)
+                count += 1
+                if date > newest:
+                    newest = date
+                    seen = set()
+                if date == newest:
+                    seen.add(key)
+                if count % self.save_every == 0:
+                    save()
+        finally:
+            try:
+                save()
+            finally:
+                if output is not None:
+                    output.close()
+        return count
+
+    def outbound(self, sink, types=None):
+        """
+        Export outbound activities to an NDJSON file path, or pass each one
+        to a callable. Returns the number of records exported.
+        """
+        return self._export(
+            'outbound', lambda start:
+            self.client.iter_recent_outbound_activities(start, types=types),
+            'createdDate', sink)
+
+    def inbound(self, sink, types=None):
+        return self._export(
+            'inbound', lambda start:
+            self.client.iter_recent_inbound_activities(start, types=types),
+            'createdDate', sink)
+
+    def deliveries(self, sink, status=None):
+        return self._export(
+            'deliveries', lambda start:
+            self.client.iter_deliveries(start=start, status=status),
+            'start', sink)
@@ -0,0 +1,306 @@
+"""
+Read-through contact cache, and a metadata cache shared by processes.
+
+>>> from bronto.cache import ContactCache, SQLiteBackend
+>>> client = Client('BRONTO_API_TOKEN', contact_cache=ContactCache())
+>>> client = Client('BRONTO_API_TOKEN', contact_cache=ContactCache(
+        SQLiteBackend('/var/cache/bronto-contacts.db', ttl=600)))
+
+``get_contact`` and ``get_contacts`` are answered from the cache when they
+can be, and every contact write made through the client drops the contacts
+it touches. Cached contacts are shared between callers, so don't modify
+them.
+
+>>> from bronto.cache import MetadataCache
+>>> client = Client('BRONTO_API_TOKEN',
+        metadata_cache=MetadataCache('/var/cache/bronto-metadata.db'))
+
+Fields, lists and messages read in full by any process are stored in the
+file, and loaded by every client on ``login`` instead of being read again.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from six.moves import cPickle as pickle
+
+
+class MemoryBackend(object):
+    """
+    In-process LRU of at most ``max_size`` entries, each kept for ``ttl``
+    seconds.
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                return None
+            self._data[key] = item
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + self.ttl, value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def _dump(value):
+    from suds.sudsobject import Object, asdict
+    if isinstance(value, Object):
+        return ('__suds__', value.__class__.__name__,
+                dict((k, _dump(v)) for k, v in asdict(value).items()))
+    if isinstance(value, list):
+        return [_dump(x) for x in value]
+    if isinstance(value, dict):
+        return dict((k, _dump(v)) for k, v in value.items())
+    return value
+
+
+def _load(value):
+    if isinstance(value, tuple) and len(value) == 3 and \
+            value[0] == '__suds__':
+        from suds.sudsobject import Factory
+        return Factory.object(value[1], dict((k, _load(v))
+                                             for k, v in value[2].items()))
+    if isinstance(value, list):
+        return [_load(x) for x in value]
+    if isinstance(value, dict):
+        return dict((k, _load(v)) for k, v in value.items())
+    return value
+
+
+class _SQLiteFile(object):
+    """
+    An SQLite file with a connection per process, opened on first use: a
+    connection must not be used by a process forked after it was opened.
+    ``_connect`` returns the connection of the calling process, after which
+    ``_lock`` guards it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._pid = None
+        self._db = None
+        self._lock = None
+
+    def _setup(self, db):
+        """
+        Create the tables of a new connection.
+        """
+
+    def _connect(self):
+        if self._pid != os.getpid():
+            # The lock may have been held by a thread that didn't survive
+            # the fork.
+            self._lock = threading.Lock()
+            self._db = sqlite3.connect(self.path, timeout=30,
+                                       check_same_thread=False)
+            self._setup(self._db)
+            self._pid = os.getpid()
+        return self._db
+
+
+class SQLiteBackend(_SQLiteFile):
+    """
+    LRU kept in an SQLite file, so it survives restarts and can be shared by
+    several processes on the same host.
+    """
+    prune_every = 100
+
+    def __init__(self, path, max_size=100000, ttl=300):
+        _SQLiteFile.__init__(self, path)
+        self.max_size = max_size
+        self.ttl = ttl
+        self._writes = 0
+
+    def _setup(self, db):
+        with db:
+            db.execute('CREATE TABLE IF NOT EXISTS cache ('
+                       'key TEXT PRIMARY KEY, value BLOB, '
+                       'expires REAL, used REAL)')
+
+    def get(self, key):
+        now = time.time()
+        db = self._connect()
+        with self._lock:
+            row = db.execute('SELECT value, expires FROM cache '
+                             'WHERE key = ?', (key, )).fetchone()
+            if row is None or row[1] < now:
+                return None
+            with db:
+                db.execute('UPDATE cache SET used = ? WHERE key = ?',
+                           (now, key))
+        return _load(pickle.loads(bytes(row[0])))
+
+    def set(self, key, value):
+        data = pickle.dumps(_dump(value), pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        db = self._connect()
+        with self._lock:
+            with db:
+                db.execute('INSERT OR REPLACE INTO cache VALUES '
+                           '(?, ?, ?, ?)', (key, sqlite3.Binary(data),
+                                            now + self.ttl, now))
+                self._writes += 1
+                if self._writes % self.prune_every == 0:
+                    self._prune(db, now)
+
+    def _prune(self, db, now):
+        db.execute('DELETE FROM cache WHERE expires < ?', (now, ))
+        db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM '
+                   'cache ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                   (self.max_size, ))
+
+    def delete(self, key):
+        db = self._connect()
+        with self._lock:
+            with db:
+                db.execute('DELETE FROM cache WHERE key = ?', (key, ))
+
+    def clear(self):
+        db = self._connect()
+        with self._lock:
+            with db:
+                db.execute('DELETE FROM cache')
+
+
+class ContactCache(object):
+    """
+    Contacts are cached by email, separately for each combination of
+    ``include_lists``, ``fields`` and ``include_sms`` they were read with.
+    An id index lets writes that only know a contact's id invalidate it.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else MemoryBackend()
+
+    def _key(self, email):
+        return 'email:%s' % email.strip().lower()
+
+    def get(self, email, options):
+        entry = self.backend.get(self._key(email))
+        if entry is None:
+            return None
+        return entry.get(options)
+
+    def set(self, contact, options):
+        email = getattr(contact, 'email', None)
+        if not email:
+            return
+        key = self._key(email)
+        entry = dict(self.backend.get(key) or {})
+        entry[options] = contact
+        self.backend.set(key, entry)
+        contact_id = getattr(contact, 'id', None)
+        if contact_id:
+            self.backend.set('id:%s' % contact_id, key)
+
+    def invalidate(self, emails=(), ids=()):
+        for contact_id in ids:
+            key = self.backend.get('id:%s' % contact_id)
+            if key is not None:
+                self.backend.delete(key)
+            self.backend.delete('id:%s' % contact_id)
+        for email in emails:
+            self.backend.delete(self._key(email))
+
+    def clear(self):
+        self.backend.clear()
+
+
+class MetadataCache(_SQLiteFile):
+    """
+    Every field, list or message of an account, stored in an SQLite file
+    that any number of processes can read and write at once.
+
+    Entries younger than ``ttl`` seconds are used as they are. Older ones,
+    up to ``max_age`` seconds, are used too, while a single process, the
+    first one to find them stale, reads them again in the background.
+    Entries written in another ``version`` of the format are ignored.
+    """
+    version = 1
+
+    def __init__(self, path, ttl=300, max_age=86400):
+        _SQLiteFile.__init__(self, path)
+        self.ttl = ttl
+        self.max_age = max_age
+
+    def _setup(self, db):
+        # Lets readers go on while another process writes.
+        db.execute('PRAGMA journal_mode=WAL')
+        with db:
+            db.execute('CREATE TABLE IF NOT EXISTS metadata ('
+                       'key TEXT PRIMARY KEY, version INTEGER, '
+                       'value BLOB, updated REAL, refreshing REAL)')
+
+    def get(self, account, kind):
+        """
+        Return ``(objects, fresh)``, or None if nothing usable is stored.
+        """
+        db = self._connect()
+        with self._lock:
+            row = db.execute('SELECT value, updated FROM metadata '
+                             'WHERE key = ? AND version = ?',
+                             ('%s:%s' % (account, kind),
+                              self.version)).fetchone()
+        if row is None:
+            return None
+        age = time.time() - row[1]
+        if age > self.max_age:
+            return None
+        return _load(pickle.loads(bytes(row[0]))), age <= self.ttl
+
+    def set(self, account, kind, objects):
+        data = pickle.dumps(_dump(list(objects)), pickle.HIGHEST_PROTOCOL)
+        db = self._connect()
+        with self._lock:
+            with db:
+                db.execute('INSERT OR REPLACE INTO metadata VALUES '
+                           '(?, ?, ?, ?, 0)',
+                           ('%s:%s' % (account, kind), self.version,
+                            sqlite3.Binary(data), time.time()))
+
+    def delete(self, account, kind):
+        db = self._connect()
+        with self._lock:
+            with db:
+                db.execute('DELETE FROM metadata WHERE key = ?',
+                           ('%s:%s' % (account, kind), ))
+
+    def claim_refresh(self, account, kind):
+        """
+        Return True if the caller should refresh a stale entry, which is
+        true for a single caller across processes until ``ttl`` passes
+        again.
+        """
+        now = time.time()
+        db = self._connect()
+        with self._lock:
+            with db:
+                cursor = db.execute(
+                    'UPDATE metadata SET refreshing = ? WHERE key = ? AND '
+                    'updated < ? AND refreshing < ?',
+                    (now, '%s:%s' % (account, kind), now - self.ttl,
+                     now - self.ttl))
+        return cursor.rowcount == 1
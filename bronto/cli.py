@@ -0,0 +1,331 @@
+"""
+``bronto`` command line tool for bulk jobs.
+
+    $ export BRONTO_API_KEY=...
+    $ bronto import contacts.csv --map "E-mail=email" --processes 8
+    $ bronto export contacts.ndjson --status active
+    $ bronto delete old_contacts.csv
+    $ bronto list add my_list contacts.csv
+
+Work is split in batches and shared across a pool of processes, each with its
+own logged in Client, so suds serialization is spread over every core. The
+WSDL is parsed once, before the pool is forked.
+Progress and throughput are reported on stderr.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+
+from bronto.client import BrontoError, Client
+from bronto.importer import ContactImporter, read_csv, read_ndjson
+
+_client = None
+_logged_in = False
+
+
+def _init_worker(token):
+    global _client
+    # Forked workers inherit the client prepared by ``main``, with its
+    # parsed WSDL and metadata caches, and only open their own session.
+    if _client is None:
+        _client = Client(token)
+    # An exception here would make the pool start the worker again, and
+    # again; a failed login is reported by the tasks instead.
+    try:
+        _login()
+    except Exception:
+        pass
+
+
+def _login():
+    global _logged_in
+    if not _logged_in:
+        _client.login()
+        _logged_in = True
+
+
+def _to_dict(obj):
+    from suds.sudsobject import Object, asdict
+    if isinstance(obj, Object):
+        return dict((key, _to_dict(value))
+                    for key, value in asdict(obj).items())
+    if isinstance(obj, list):
+        return [_to_dict(x) for x in obj]
+    return obj
+
+
+def _write_errors(response, batch):
+    return [(row_number, '%s: %s' % (result.errorCode, result.errorString))
+            for (row_number, item), result in zip(batch, response.results)
+            if getattr(result, 'isError', False)]
+
+
+def _run(task):
+    """
+    Run one batch in a worker process. Returns ``(count, errors)`` where
+    errors is a list of ``(row_number, message)``.
+    """
+    operation, batch, options = task
+    if operation == 'export':
+        return _export_page(batch, options)
+    try:
+        _login()
+        items = [item for row_number, item in batch]
+        if operation == 'import':
+            response = _client.add_or_update_contacts(items)
+        elif operation == 'delete':
+            response = _client.delete_contacts(items)
+            # Results follow the contacts found, not the rows given.
+            return len(batch), [(None, '%s: %s' % (x.errorCode, x.errorString))
+                                for x in response.results
+                                if getattr(x, 'isError', False)]
+        elif operation == 'list-add':
+            response = _client.add_contacts_to_list(
+                {'name': options['list']}, [{'email': x} for x in items])
+        elif operation == 'list-remove':
+            response = _client.remove_contacts_from_list(
+                {'name': options['list']}, [{'email': x} for x in items])
+    except Exception as e:
+        # Short of a partial failure (a fault, the network, an invalid
+        # record), the whole batch fails, but not the job.
+        if not isinstance(e, BrontoError) or e.response is None:
+            return len(batch), [(row_number, str(e))
+                                for row_number, item in batch]
+        response = e.response
+    return len(batch), _write_errors(response, batch)
+
+
+def _export_page(page_number, options):
+    """
+    Read one page of contacts in a worker process. Returns ``(contacts,
+    errors)`` with the contacts converted to plain dicts, or None if the
+    page couldn't be read.
+    """
+    try:
+        _login()
+        contact_filter = _client._contact_query(**options).compile(
+            _client._client.factory)
+        contacts = _client._read_contacts(contact_filter,
+                                          page_number=page_number)
+    except Exception as e:
+        return None, [(None, 'page %s: %s' % (page_number, e))]
+    return [_to_dict(x) for x in contacts or []], []
+
+
+class Progress(object):
+    """
+    Count processed rows and report throughput every ``interval`` seconds.
+    """
+
+    def __init__(self, stream=sys.stderr, interval=5):
+        self.stream = stream
+        self.interval = interval
+        self.processed = 0
+        self.failed = 0
+        self.started = self.reported = time.time()
+
+    def update(self, processed, errors):
+        self.processed += processed
+        self.failed += len(errors)
+        for row_number, message in errors:
+            if row_number is not None:
+                message = 'row %s: %s' % (row_number, message)
+            print(message, file=self.stream)
+        if time.time() - self.reported >= self.interval:
+            self.report()
+
+    def report(self):
+        self.reported = time.time()
+        elapsed = max(self.reported - self.started, 1e-6)
+        print('%d processed, %d failed, %.1f/s'
+              % (self.processed, self.failed, self.processed / elapsed),
+              file=self.stream)
+
+
+def _dispatch(pool, tasks, window, callback):
+    """
+    Apply ``_run`` to every task, with at most ``window`` tasks queued at
+    once so that large inputs are never read into memory all at once.
+    """
+    pending = []
+    for task in tasks:
+        pending.append(pool.apply_async(_run, (task, )))
+        while len(pending) >= window or (pending and pending[0].ready()):
+            callback(*pending.pop(0).get())
+    for result in pending:
+        callback(*result.get())
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _read_rows(path):
+    if path.lower().endswith('.csv'):
+        return read_csv(path)
+    return read_ndjson(path)
+
+
+def _emails(path, column):
+    for row_number, row in _read_rows(path):
+        if row.get(column):
+            yield row_number, row[column].strip()
+
+
+def _parse_date(value):
+    for date_format in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError('Invalid date: %s' % value)
+
+
+def _import_tasks(args, client, progress):
+    mapping = dict(x.split('=', 1) for x in args.map)
+    importer = ContactImporter(client, mapping=mapping)
+    rows = []
+    for row_number, row in _read_rows(args.file):
+        try:
+            rows.append((row_number, importer.map_row(row)))
+        except (KeyError, ValueError) as e:
+            progress.update(1, [(row_number, str(e))])
+            continue
+        if len(rows) >= args.batch_size:
+            yield ('import', rows, None)
+            rows = []
+    if rows:
+        yield ('import', rows, None)
+
+
+def _export(args, pool, progress):
+    options = {'status': args.status, 'list_ids': args.list_id,
+               'created_since': args.created_since,
+               'modified_since': args.modified_since}
+    window = 2 * args.processes
+    page_number = 1
+    with open(args.file, 'w') as output:
+        while True:
+            results = [pool.apply_async(_run, (('export', x, options), ))
+                       for x in range(page_number, page_number + window)]
+            page_number += window
+            done = False
+            failed = 0
+            for result in results:
+                contacts, errors = result.get()
+                if contacts is None:
+                    # Reported, but the pages after it are still read.
+                    failed += 1
+                    contacts = []
+                elif not contacts:
+                    done = True
+                for contact in contacts:
+                    output.write(json.dumps(contact, default=str) + '\n')
+                progress.update(len(contacts), errors)
+            # Stop at the end of the data, or when no page can be read.
+            if done or failed == len(results):
+                return
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='bronto',
+                                     description='Bulk jobs against Bronto.')
+    parser.add_argument('--token', default=os.environ.get('BRONTO_API_KEY'),
+                        help='API token, defaults to $BRONTO_API_KEY')
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--progress-interval', type=float, default=5)
+    commands = parser.add_subparsers(dest='command')
+
+    import_ = commands.add_parser('import', help='Add or update contacts '
+                                  'from a CSV or NDJSON file')
+    import_.add_argument('file')
+    import_.add_argument('--map', action='append', default=[],
+                         metavar='COLUMN=NAME',
+                         help='Map a column to a contact attribute or field')
+
+    export = commands.add_parser('export',
+                                 help='Write contacts to an NDJSON file')
+    export.add_argument('file')
+    export.add_argument('--status', action='append')
+    export.add_argument('--list-id', action='append')
+    export.add_argument('--created-since', type=_parse_date)
+    export.add_argument('--modified-since', type=_parse_date)
+
+    delete = commands.add_parser('delete', help='Delete the contacts listed '
+                                 'in a CSV or NDJSON file')
+    delete.add_argument('file')
+    delete.add_argument('--column', default='email')
+
+    list_ = commands.add_parser('list', help='Add contacts to a list or '
+                                'remove them from it')
+    list_.add_argument('action', choices=['add', 'remove'])
+    list_.add_argument('list', help='Name of the list')
+    list_.add_argument('file')
+    list_.add_argument('--column', default='email')
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.error('A command is required.')
+    if not args.token:
+        parser.error('Provide a token with --token or $BRONTO_API_KEY.')
+
+    global _client
+    progress = Progress(interval=args.progress_interval)
+    client = _client = Client(args.token)
+    # Fail now, rather than in every worker, if the token is refused or
+    # Bronto can't be reached.
+    try:
+        client.login()
+    except Exception as e:
+        print('Could not log in: %s' % e, file=sys.stderr)
+        return 1
+    if args.command == 'import':
+        # Custom fields are read once, here, and inherited by the workers.
+        client.get_fields()
+    pool = multiprocessing.Pool(args.processes, _init_worker, (args.token, ))
+    try:
+        window = 2 * args.processes
+        if args.command == 'export':
+            _export(args, pool, progress)
+        else:
+            if args.command == 'import':
+                tasks = _import_tasks(args, client, progress)
+            else:
+                operation = ('delete' if args.command == 'delete'
+                             else 'list-%s' % args.action)
+                options = {'list': getattr(args, 'list', None)}
+                tasks = ((operation, batch, options) for batch in
+                         _batches(_emails(args.file, args.column),
+                                  args.batch_size))
+            _dispatch(pool, tasks, window, progress.update)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    progress.report()
+    return 1 if progress.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,54 +1,297 @@
+import hashlib
+import os
+import threading
+
 import six
-from suds import WebFault
-import suds.client
+
+from bronto.query import ContactQuery
+from bronto.utils import (Coalescer, SingleFlight, format_date,
+                          merge_contacts)
+from bronto.validation import get_validator
 
 API_ENDPOINT = 'https://api.bronto.com/v4?wsdl'
 
+DELIVERY_REQUIRED_ATTRIBUTES = ['start', 'messageId', 'type', 'fromEmail',
+                                #'replyEmail', Even if the doc says so, it's not required
+                                'fromName', 'recipients']
+
+
+class WebFault(Exception):
+    """
+    Placeholder for ``suds.WebFault`` until suds is loaded by ``_load_suds``.
+    No service call can happen before that, so nothing ever raises it.
+    """
+
+
+def _load_suds():
+    """
+    Import suds on first use, as it is slow to import and not needed until a
+    Client logs in.
+    """
+    global WebFault
+    import suds.client
+    WebFault = suds.WebFault
+    return suds.client
+
 
 class BrontoError(Exception):
-    pass
+    """
+    Raised for any failure reported by Bronto. When a write call was accepted
+    but some of its records were rejected, the full write response is
+    available as ``response`` so callers can inspect the per-record results.
+    """
+    def __init__(self, message, response=None):
+        super(BrontoError, self).__init__(message)
+        self.response = response
 
 
 class Client(object):
-    _valid_contact_fields = ['email', 'mobileNumber', 'status', 'msgPref',
-                             'source', 'customSource', 'listIds', 'fields',
-                             'SMSKeywordIDs']
-    _valid_order_fields = ['id', 'email', 'contactId', 'products', 'orderDate',
-                           'tid']
-    _valid_product_fields = ['id', 'sku', 'name', 'description', 'category',
-                             'image', 'url', 'quantity', 'price']
-    _valid_field_fields = ['id', 'name', 'label', 'type', 'visibility', 'options']
-    _valid_list_fields = ['id', 'name', 'label']
-    _valid_delivery_fields = ['authentication', 'fatigueOverride', 'fields',
-            'fromEmail', 'fromName', 'messageId', 'messageRuleId', 'optin',
-            'recipients', 'remail', 'replyEmail', 'replyTracking', 'start',
-            'throttle', 'type']
-
     _cached_fields = {}
+    _cached_fields_by_id = {}
     _cached_all_fields = False
 
     _cached_lists = {}
+    _cached_lists_by_id = {}
     _cached_all_lists = False
 
     _cached_messages = {}
+    _cached_messages_by_id = {}
     _cached_all_messages = False
 
-    def __init__(self, token, **kwargs):
+    # How many email addresses go in a single readContacts filter. Kept well
+    # below the size of a page, so the contacts of a chunk come in one page.
+    _email_chunk_size = 100
+
+    def __init__(self, token, max_workers=None, contact_cache=None,
+                 transport=None, dispatcher=None, metadata_cache=None,
+                 **kwargs):
         if not token or not isinstance(token, six.string_types):
             raise ValueError('Must supply a token as a non empty string.')
 
         self._token = token
         self._client = None
+        self._max_workers = max_workers
+        self._executor = None
+        self._local = threading.local()
+        self._single_flight = SingleFlight()
+        self._contact_lookups = Coalescer()
+        self._contact_cache = contact_cache
+        self._transport = transport
+        self._dispatcher = dispatcher
+        self._metadata_cache = metadata_cache
+        self._pid = os.getpid()
+
+    def load_wsdl(self):
+        """
+        Parse the WSDL without opening a session. In a pre-forking server,
+        calling this (and optionally ``login`` and ``prefetch_metadata``) in
+        the parent lets every forked worker share the parsed schema and the
+        metadata caches; each worker then only has to call ``login`` to open
+        its own session.
+        """
+        if self._client is None:
+            suds_client = _load_suds()
+            options = {}
+            transport = self._transport
+            if self._dispatcher is not None:
+                from bronto.dispatch import DispatchTransport
+                transport = DispatchTransport(self._dispatcher, transport)
+            if transport is not None:
+                options['transport'] = transport
+            self._client = suds_client.Client(API_ENDPOINT, **options)
+
+    def _after_fork(self):
+        """
+        Drop the state a forked process can't share with its parent: the
+        worker pool, whose threads did not survive the fork, its per-thread
+        clones, and the locks of calls that were in flight.
+        """
+        self._pid = os.getpid()
+        self._executor = None
+        self._local = threading.local()
+        self._single_flight = SingleFlight()
+        self._contact_lookups = Coalescer()
 
     def login(self):
-        self._client = suds.client.Client(API_ENDPOINT)
+        if self._pid != os.getpid():
+            self._after_fork()
+        self.load_wsdl()
         try:
+            self._client.set_options(soapheaders=())
             self.session_id = self._client.service.login(self._token)
             session_header = self._client.factory.create('sessionHeader')
             session_header.sessionId = self.session_id
             self._client.set_options(soapheaders=session_header)
         except WebFault as e:
             raise BrontoError(e.message)
+        if self._metadata_cache is not None:
+            self._load_metadata()
+
+    def clone(self):
+        """
+        Return a new Client sharing this one's session and parsed WSDL, but
+        with its own suds client, so it can safely be used from another thread.
+        Clones have no worker pool of their own: work they submit, like the
+        chunks of a lookup made from a worker, runs inline.
+        """
+        other = self.__class__(self._token,
+                               contact_cache=self._contact_cache,
+                               transport=self._transport,
+                               dispatcher=self._dispatcher,
+                               metadata_cache=self._metadata_cache)
+        other.session_id = self.session_id
+        other._client = self._client.clone()
+        other._single_flight = self._single_flight
+        other._contact_lookups = self._contact_lookups
+        other._cached_all_fields = self._cached_all_fields
+        other._cached_all_lists = self._cached_all_lists
+        other._cached_all_messages = self._cached_all_messages
+        return other
+
+    def _worker(self):
+        """
+        Return the clone of this Client private to the calling thread.
+        """
+        worker = getattr(self._local, 'client', None)
+        if worker is None:
+            worker = self._local.client = self.clone()
+        return worker
+
+    def _submit(self, func, *args, **kwargs):
+        """
+        Schedule ``func(client, *args, **kwargs)`` on the worker pool and
+        return a Future. ``client`` is a per-thread clone of this Client.
+        Without ``max_workers`` the call runs inline on this Client.
+        """
+        from concurrent.futures import Future, ThreadPoolExecutor
+        if self._pid != os.getpid():
+            self._after_fork()
+        if not self._max_workers or self._max_workers < 2:
+            future = Future()
+            try:
+                future.set_result(func(self, *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self._max_workers)
+        return self._executor.submit(
+            lambda: func(self._worker(), *args, **kwargs))
+
+    def _validator(self, type_name, name, required=()):
+        """
+        Return the ``bronto.validation.RecordValidator`` checking records
+        sent as the schema type ``type_name``.
+        """
+        return get_validator(self._client, type_name, name, required)
+
+    def _raise_for_errors(self, response, action):
+        if hasattr(response, 'errors'):
+            err_str = ', '.join(['%s: %s' % (response.results[x].errorCode,
+                                             response.results[x].errorString)
+                                 for x in response.errors])
+            raise BrontoError('An error occurred while %s: %s'
+                              % (action, err_str), response)
+
+    def _read_pages(self, method, obj_filter):
+        """
+        Call a read* service method for every page of results.
+        """
+        results = []
+        page_number = 1
+        while True:
+            page = method(obj_filter, pageNumber=page_number)
+            if not page:
+                return results
+            results.extend(page)
+            page_number += 1
+
+    def _get_by_ids(self, ids, by_id, by_name, filter_name, method):
+        missing = [x for x in ids if x not in by_id]
+        if missing:
+            obj_filter = self._client.factory.create(filter_name)
+            obj_filter.id = missing
+            filter_type = self._client.factory.create('filterType')
+            if len(missing) > 1:
+                obj_filter.type = filter_type.OR
+            else:
+                obj_filter.type = filter_type.AND
+            try:
+                for obj in self._read_pages(method, obj_filter):
+                    by_id[obj.id] = obj
+                    by_name[obj.name] = obj
+            except WebFault as e:
+                raise BrontoError(e.message)
+        return [by_id[x] for x in ids if x in by_id]
+
+    def prefetch_metadata(self):
+        """
+        Load every field, list and message in one go, so that later lookups
+        by name or by id are served from the cache.
+        """
+        self._cached_all_fields = False
+        self._cached_all_lists = False
+        self._cached_all_messages = False
+        self.get_fields()
+        self.get_lists()
+        self.get_messages()
+
+    def _metadata_account(self):
+        return hashlib.sha1(self._token.encode('utf-8')).hexdigest()
+
+    def _load_metadata(self):
+        """
+        Fill the metadata caches from ``metadata_cache``, refreshing stale
+        entries from a background thread.
+        """
+        account = self._metadata_account()
+        stale = []
+        for kind in ('fields', 'lists', 'messages'):
+            entry = self._metadata_cache.get(account, kind)
+            if entry is None:
+                continue
+            objects, fresh = entry
+            by_name = getattr(self, '_cached_%s' % kind)
+            by_id = getattr(self, '_cached_%s_by_id' % kind)
+            for obj in objects:
+                by_name[obj.name] = obj
+                by_id[obj.id] = obj
+            setattr(self, '_cached_all_%s' % kind, True)
+            if not fresh and self._metadata_cache.claim_refresh(account, kind):
+                stale.append(kind)
+        if stale:
+            thread = threading.Thread(target=self._refresh_metadata,
+                                      args=(self.clone(), stale))
+            thread.daemon = True
+            thread.start()
+
+    @staticmethod
+    def _refresh_metadata(client, kinds):
+        for kind in kinds:
+            setattr(client, '_cached_all_%s' % kind, False)
+            try:
+                getattr(client, 'get_%s' % kind)()
+            except BrontoError:
+                # Another process claims the refresh once ttl has passed.
+                pass
+
+    def _store_metadata(self, kind, objects):
+        if self._metadata_cache is not None:
+            self._metadata_cache.set(self._metadata_account(), kind, objects)
+
+    def _drop_metadata(self, kind):
+        if self._metadata_cache is not None:
+            self._metadata_cache.delete(self._metadata_account(), kind)
+
+    def _invalidate_contacts(self, contacts, emails=()):
+        """
+        Drop written contacts from the contact cache, if there is one.
+        """
+        if self._contact_cache is not None:
+            self._contact_cache.invalidate(
+                emails=[x.email for x in contacts
+                        if getattr(x, 'email', None)] + list(emails),
+                ids=[x.id for x in contacts if getattr(x, 'id', None)])
 
     def _construct_contact_fields(self, fields):
         final_fields = []
@@ -66,32 +309,39 @@ class Client(object):
             final_fields.append(field_object)
         return final_fields
 
-    def add_contacts(self, contacts):
-        final_contacts = []
+    def _construct_contact(self, contact):
+        contact_obj = self._client.factory.create('contactObject')
+        # FIXME: Add special handling for listIds, SMSKeywordIDs
+        for field, value in six.iteritems(contact):
+            if field == 'fields':
+                field_objs = self._construct_contact_fields(value)
+                contact_obj.fields = field_objs
+            else:
+                setattr(contact_obj, field, value)
+        return contact_obj
+
+    def add_contacts(self, contacts, merge=False):
+        """
+        With ``merge``, records for the same contact are merged first, see
+        ``bronto.utils.merge_contacts``.
+        """
+        if merge:
+            contacts = merge_contacts(contacts)
+        contacts = list(contacts)
         for contact in contacts:
             if not any([contact.get('email'), contact.get('mobileNumber')]):
                 raise ValueError('Must provide either an email or mobileNumber')
-            contact_obj = self._client.factory.create('contactObject')
-            # FIXME: Add special handling for listIds, SMSKeywordIDs
-            for field, value in six.iteritems(contact):
-                if field == 'fields':
-                    field_objs = self._construct_contact_fields(value)
-                    contact_obj.fields = field_objs
-                elif field not in self._valid_contact_fields:
-                    raise KeyError('Invalid contact attribute: %s' % field)
-                else:
-                    setattr(contact_obj, field, value)
-            final_contacts.append(contact_obj)
+        self._validator('contactObject', 'contact').validate(contacts)
+        final_contacts = []
+        for contact in contacts:
+            final_contacts.append(self._construct_contact(contact))
         try:
             response = self._client.service.addContacts(final_contacts)
-            if hasattr(response, 'errors'):
-                err_str = ', '.join(['%s: %s' % (response.results[x].errorCode,
-                                                 response.results[x].errorString)
-                                     for x in response.errors])
-                raise BrontoError('An error occurred while adding contacts: %s'
-                                  % err_str)
+            self._raise_for_errors(response, 'adding contacts')
         except WebFault as e:
             raise BrontoError(e.message)
+        finally:
+            self._invalidate_contacts(final_contacts)
         return response
 
     def add_contact(self, contact):
@@ -101,24 +351,25 @@ class Client(object):
         except:
             return contact.results
 
-    def get_contacts(self, emails, include_lists=False, fields=[],
-                     page_number=1, include_sms=False):
-        final_emails = []
-        filter_operator = self._client.factory.create('filterOperator')
-        fop = filter_operator.EqualTo
-        for email in emails:
-            contact_email = self._client.factory.create('stringValue')
-            contact_email.operator = fop
-            contact_email.value = email
-            final_emails.append(contact_email)
-        contact_filter = self._client.factory.create('contactFilter')
-        contact_filter.email = final_emails
-        filter_type = self._client.factory.create('filterType')
-        if len(final_emails) > 1:
-            contact_filter.type = filter_type.OR
-        else:
-            contact_filter.type = filter_type.AND
+    def _contact_query(self, created_since=None, modified_since=None,
+                       status=None, list_ids=None):
+        """
+        Build the ContactQuery of ``iter_contacts``, every criterion being
+        AND'ed with the others.
+        """
+        query = ContactQuery()
+        if created_since is not None:
+            query.created('After', created_since)
+        if modified_since is not None:
+            query.modified('After', modified_since)
+        if status:
+            query.status(status)
+        if list_ids:
+            query.list_id(list_ids)
+        return query
 
+    def _read_contacts(self, contact_filter, include_lists=False, fields=[],
+                       page_number=1, include_sms=False):
         try:
             field_objs = self.get_fields(fields)
             field_ids = [x.id for x in field_objs]
@@ -132,14 +383,130 @@ class Client(object):
             raise BrontoError(e.message)
         return response
 
+    def get_contacts(self, emails, include_lists=False, fields=[],
+                     page_number=1, include_sms=False):
+        """
+        Return the list of contacts with any of the given emails, all of
+        them, through ``get_contacts_by_email``. They all come with the first
+        page: any other ``page_number`` is empty.
+        """
+        options = (include_lists, tuple(fields), include_sms)
+        emails = list(emails)
+        if page_number != 1 or not emails:
+            return []
+        if self._contact_cache is not None:
+            cached = [self._contact_cache.get(x, options) for x in emails]
+            if all(x is not None for x in cached):
+                return cached
+        contacts = list(self.get_contacts_by_email(emails, *options).values())
+        if self._contact_cache is not None:
+            for contact in contacts:
+                self._contact_cache.set(contact, options)
+        return contacts
+
+    def find_contacts(self, query, include_lists=False, fields=[],
+                      include_sms=False):
+        """
+        Yield every contact matching a ``bronto.query.ContactQuery``, reading
+        as many pages as needed.
+        """
+        contact_filter = query.compile(self._client.factory)
+        field_names = {}
+        if query.fields:
+            fields = list(fields) + [x for x, y in query.fields
+                                     if x not in fields]
+            field_names = dict((x.id, x.name) for x in self.get_fields())
+        page_number = 1
+        while True:
+            contacts = self._read_contacts(contact_filter, include_lists,
+                                           fields, page_number, include_sms)
+            if not contacts:
+                break
+            for contact in contacts:
+                if query.match(contact, field_names):
+                    yield contact
+            page_number += 1
+
+    def iter_contacts(self, created_since=None, modified_since=None,
+                      status=None, list_ids=None, include_lists=False,
+                      fields=[], include_sms=False):
+        """
+        Yield every contact matching the filters, reading as many pages as
+        needed. ``status`` and ``list_ids`` may be a single status or a list
+        of statuses and a list of list ids.
+        >>> for contact in client.iter_contacts(
+                    modified_since=datetime(2014, 5, 7), status='active'):
+        >>>     ...
+        """
+        query = self._contact_query(created_since, modified_since, status,
+                                    list_ids)
+        return self.find_contacts(query, include_lists, fields, include_sms)
+
+    def get_contacts_by_email(self, emails, include_lists=False, fields=[],
+                              include_sms=False):
+        """
+        Look up any number of contacts by email, returning a dict mapping each
+        email found to its contact. The emails are deduplicated (ignoring
+        case) and split in chunks of ``_email_chunk_size``, every chunk being
+        read with a single readContacts call; chunks run concurrently when the
+        client has a pool.
+        >>> client.get_contacts_by_email(['me@domain.com', 'you@domain.com'])
+        {'me@domain.com': <contactObject>, 'you@domain.com': <contactObject>}
+        """
+        requested = {}
+        for email in emails:
+            requested.setdefault(email.strip().lower(), email)
+        unique_emails = [x.strip() for x in requested.values()]
+        # Resolve the fields once so the workers find them in the cache.
+        self.get_fields(fields)
+
+        def read_chunk(client, chunk):
+            query = ContactQuery('OR')
+            for email in chunk:
+                query.email('EqualTo', email)
+            # Every email matches one contact at most: the first page holds
+            # them all, no need to read the empty one after it.
+            contacts = client._read_contacts(
+                query.compile(client._client.factory), include_lists, fields,
+                1, include_sms)
+            return list(contacts or [])
+
+        size = self._email_chunk_size
+        futures = [self._submit(read_chunk, unique_emails[x:x + size])
+                   for x in range(0, len(unique_emails), size)]
+        found = {}
+        for future in futures:
+            for contact in future.result():
+                email = requested.get((contact.email or '').lower())
+                if email is not None:
+                    found[email] = contact
+        return found
+
     def get_contact(self, email, include_lists=False, fields=[],
                     include_sms=False):
-        contact = self.get_contacts([email, ], include_lists, fields, 1,
-                                    include_sms)
-        try:
-            return contact[0]
-        except:
-            return contact
+        """
+        Concurrent calls are coalesced: callers asking for the same email
+        share one lookup, and lookups of different emails made while another
+        is running are sent together in a single readContacts call.
+        """
+        options = (include_lists, tuple(fields), include_sms)
+        if self._contact_cache is not None:
+            contact = self._contact_cache.get(email, options)
+            if contact is not None:
+                return contact
+
+        def lookup(emails):
+            found = self.get_contacts_by_email(emails, *options)
+            if self._contact_cache is not None:
+                for contact in found.values():
+                    self._contact_cache.set(contact, options)
+            return found
+
+        contact = self._contact_lookups.get(
+            options, email.strip().lower(), email, lookup)
+        if contact is None:
+            return []
+        return contact
 
     def update_contacts(self, contacts):
         """
@@ -156,41 +523,34 @@ class Client(object):
                                    })
         >>>
         """
-        contact_objs = self.get_contacts(contacts.keys())
+        self._validator('contactObject', 'contact').validate(contacts.values())
+        contact_objs = self.get_contacts_by_email(contacts.keys())
         final_contacts = []
         for email, contact_info in six.iteritems(contacts):
             try:
-                real_contact = list(filter(lambda x: x.email == email,
-                                           contact_objs))[0]
-            except IndexError:
+                real_contact = contact_objs[email]
+            except KeyError:
                 raise BrontoError('Contact not found: %s' % email)
             for field, value in six.iteritems(contact_info):
                 if field == 'fields':
                     field_objs = self._construct_contact_fields(value)
-                    all_fields = self.get_fields()
-                    field_names = dict([(x.id, x.name) for x in all_fields])
-                    old_fields = dict([(field_names[x.fieldId], x)
+                    old_fields = dict([(self.get_field_by_id(x.fieldId).name, x)
                                        for x in real_contact.fields])
-                    new_fields = dict([(field_names[x.fieldId], x)
+                    new_fields = dict([(self.get_field_by_id(x.fieldId).name, x)
                                        for x in field_objs])
                     old_fields.update(new_fields)
                     # This sounds backward, but it's not. Honest.
                     real_contact.fields = list(old_fields.values())
-                elif field not in self._valid_contact_fields:
-                    raise KeyError('Invalid contact attribute: %s' % field)
                 else:
                     setattr(real_contact, field, value)
             final_contacts.append(real_contact)
         try:
             response = self._client.service.updateContacts(final_contacts)
-            if hasattr(response, 'errors'):
-                err_str = ', '.join(['%s: %s' % (response.results[x].errorCode,
-                                                 response.results[x].errorString)
-                                     for x in response.errors])
-                raise BrontoError('An error occurred while adding contacts: %s'
-                                  % err_str)
+            self._raise_for_errors(response, 'adding contacts')
         except WebFault as e:
             raise BrontoError(e.message)
+        finally:
+            self._invalidate_contacts(final_contacts, contacts.keys())
         return response
 
     def update_contact(self, email, contact_info):
@@ -200,34 +560,29 @@ class Client(object):
         except:
             return contact.results
 
-    def add_or_update_contacts(self, contacts):
-        # FIXME: This is entirely too similar to add_contacts.
-        # TODO: These two should be refactored.
-        final_contacts = []
+    def add_or_update_contacts(self, contacts, merge=False):
+        """
+        With ``merge``, records for the same contact are merged first, see
+        ``bronto.utils.merge_contacts``.
+        """
+        if merge:
+            contacts = merge_contacts(contacts)
+        contacts = list(contacts)
         for contact in contacts:
             if not any([contact.get('id'), contact.get('email'),
                         contact.get('mobileNumber')]):
                 raise ValueError('Must provide one of: id, email, mobileNumber')
-            contact_obj = self._client.factory.create('contactObject')
-            for field, value in six.iteritems(contact):
-                if field == 'fields':
-                    field_objs = self._construct_contact_fields(value)
-                    contact_obj.fields = field_objs
-                elif field not in self._valid_contact_fields:
-                    raise KeyError('Invalid contact attribute: %s' % field)
-                else:
-                    setattr(contact_obj, field, value)
-            final_contacts.append(contact_obj)
+        self._validator('contactObject', 'contact').validate(contacts)
+        final_contacts = []
+        for contact in contacts:
+            final_contacts.append(self._construct_contact(contact))
         try:
             response = self._client.service.addOrUpdateContacts(final_contacts)
-            if hasattr(response, 'errors'):
-                err_str = ', '.join(['%s: %s' % (response.results[x].errorCode,
-                                                 response.results[x].errorString)
-                                     for x in response.errors])
-                raise BrontoError('An error occurred while adding contacts: %s'
-                                  % err_str)
+            self._raise_for_errors(response, 'adding contacts')
         except WebFault as e:
             raise BrontoError(e.message)
+        finally:
+            self._invalidate_contacts(final_contacts)
         return response
 
     def add_or_update_contact(self, contact):
@@ -238,11 +593,13 @@ class Client(object):
             return contact.results
 
     def delete_contacts(self, emails):
-        contacts = self.get_contacts(emails)
+        contacts = list(self.get_contacts_by_email(emails).values())
         try:
             response = self._client.service.deleteContacts(contacts)
         except WebFault as e:
             raise BrontoError(e.message)
+        finally:
+            self._invalidate_contacts(contacts, emails)
         return response
 
     def delete_contact(self, email):
@@ -253,10 +610,13 @@ class Client(object):
             return response.results
 
     def add_orders(self, orders):
-        final_orders = []
+        orders = list(orders)
         for order in orders:
             if not order.get('id', None):
                 raise ValueError('Each order must provide an id')
+        self._validator('orderObject', 'order').validate(orders)
+        final_orders = []
+        for order in orders:
             order_obj = self._client.factory.create('orderObject')
             for field, value in six.iteritems(order):
                 if field == 'products':
@@ -264,25 +624,15 @@ class Client(object):
                     for product in value:
                         product_obj = self._client.factory.create('productObject')
                         for pfield, pvalue in six.iteritems(product):
-                            if pfield not in self._valid_product_fields:
-                                raise KeyError('Invalid product attribute: %s'
-                                               % pfield)
                             setattr(product_obj, pfield, pvalue)
                         final_products.append(product_obj)
                     order_obj.products = final_products
-                elif field not in self._valid_order_fields:
-                    raise KeyError('Invalid order attribute: %s' % field)
                 else:
                     setattr(order_obj, field, value)
             final_orders.append(order_obj)
         try:
             response = self._client.service.addOrUpdateOrders(final_orders)
-            if hasattr(response, 'errors'):
-                err_str = ', '.join(['%s: %s' % (response.results[x].errorCode,
-                                                 response.results[x].errorString)
-                                     for x in response.errors])
-                raise BrontoError('An error occurred while adding orders: %s'
-                                  % err_str)
+            self._raise_for_errors(response, 'adding orders')
         except WebFault as e:
             raise BrontoError(e.message)
         return response
@@ -343,28 +693,21 @@ class Client(object):
         >>>
         """
         required_attributes = ['name', 'label', 'type']
+        fields = list(fields)
+        self._validator('fieldObject', 'field',
+                        required_attributes).validate(fields)
         final_fields = []
         for field in fields:
-            if not all(key in field for key in required_attributes):
-                raise ValueError('The attributes %s are required.'
-                        % required_attributes)
             field_obj = self._client.factory.create('fieldObject')
             for attribute, value in six.iteritems(field):
-                if attribute not in self._valid_field_fields:
-                    raise KeyError('Invalid field attribute: %s' % attribute)
-                else:
-                    setattr(field_obj, attribute, value)
+                setattr(field_obj, attribute, value)
             final_fields.append(field_obj)
         try:
             response = self._client.service.addFields(final_fields)
-            if hasattr(response, 'errors'):
-                err_str = ', '.join(['%s: %s' % (response.results[x].errorCode,
-                                                 response.results[x].errorString)
-                                     for x in response.errors])
-                raise BrontoError('An error occurred while adding fields: %s'
-                                  % err_str)
+            self._raise_for_errors(response, 'adding fields')
             # If no error we force to refresh the fields' cache
             self._cached_all_fields = False
+            self._drop_metadata('fields')
         except WebFault as e:
             raise BrontoError(e.message)
         return response
@@ -377,7 +720,14 @@ class Client(object):
             return request.results
 
     def get_fields(self, field_names=[]):
-        #TODO: Support search per field_id
+        """
+        Concurrent calls for the same names share a single read.
+        """
+        return list(self._single_flight.do(
+            ('fields', tuple(field_names)), self._get_fields,
+            field_names))
+
+    def _get_fields(self, field_names):
         final_fields = []
         cached = []
         filter_operator = self._client.factory.create('filterOperator')
@@ -400,12 +750,18 @@ class Client(object):
 
         if not self._cached_all_fields:
             try:
-                response = self._client.service.readFields(field_filter,
-                                                           pageNumber=1)
+                if final_fields:
+                    response = self._client.service.readFields(field_filter,
+                                                               pageNumber=1)
+                else:
+                    response = self._read_pages(
+                            self._client.service.readFields, field_filter)
                 for field in response:
                     self._cached_fields[field.name] = field
+                    self._cached_fields_by_id[field.id] = field
                 if not len(final_fields):
                     self._cached_all_fields = True
+                    self._store_metadata('fields', response)
             except WebFault as e:
                 raise BrontoError(e.message)
         else:
@@ -422,6 +778,18 @@ class Client(object):
         except:
             return field
 
+    def get_fields_by_id(self, field_ids):
+        return self._get_by_ids(field_ids, self._cached_fields_by_id,
+                                self._cached_fields, 'fieldsFilter',
+                                self._client.service.readFields)
+
+    def get_field_by_id(self, field_id):
+        field = self.get_fields_by_id([field_id, ])
+        try:
+            return field[0]
+        except:
+            return field
+
     def delete_fields(self, field_ids):
         fields = []
         for field_id in field_ids:
@@ -432,6 +800,7 @@ class Client(object):
             response = self._client.service.deleteFields(fields)
         except WebFault as e:
             raise BrontoError(e.message)
+        self._drop_metadata('fields')
         return response
 
     def delete_field(self, field_id):
@@ -453,28 +822,21 @@ class Client(object):
         >>>
         """
         required_attributes = ['name', 'label']
+        lists = list(lists)
+        self._validator('mailListObject', 'list',
+                        required_attributes).validate(lists)
         final_lists = []
         for list_ in lists: # Use list_ as list is a built-in object
-            if not all(key in list_ for key in required_attributes):
-                raise ValueError('The attributes %s are required.'
-                                 % required_attributes)
             list_obj = self._client.factory.create('mailListObject')
             for attribute, value in six.iteritems(list_):
-                if attribute not in self._valid_list_fields:
-                    raise KeyError('Invalid list attribute: %s' % attribute)
-                else:
-                    setattr(list_obj, attribute, value)
+                setattr(list_obj, attribute, value)
             final_lists.append(list_obj)
         try:
             response = self._client.service.addLists(final_lists)
-            if hasattr(response, 'errors'):
-                err_str = ', '.join(['%s: %s' % (response.results[x].errorCode,
-                                                 response.results[x].errorString)
-                                     for x in response.errors])
-                raise BrontoError('An error occurred while adding fields: %s'
-                                  % err_str)
-            # If no error we force to refresh the fields' cache
-            self._cached_all_fields = False
+            self._raise_for_errors(response, 'adding fields')
+            # If no error we force to refresh the lists' cache
+            self._cached_all_lists = False
+            self._drop_metadata('lists')
         except WebFault as e:
             raise BrontoError(e.message)
         return response
@@ -487,7 +849,14 @@ class Client(object):
             return request.results
 
     def get_lists(self, list_names=[]):
-        #TODO: Support search per list_id
+        """
+        Concurrent calls for the same names share a single read.
+        """
+        return list(self._single_flight.do(
+            ('lists', tuple(list_names)), self._get_lists,
+            list_names))
+
+    def _get_lists(self, list_names):
         final_lists = []
         cached = []
         filter_operator = self._client.factory.create('filterOperator')
@@ -514,12 +883,18 @@ class Client(object):
 
         if not self._cached_all_lists:
             try:
-                response = self._client.service.readLists(list_filter,
-                                                          pageNumber=1)
+                if final_lists:
+                    response = self._client.service.readLists(list_filter,
+                                                              pageNumber=1)
+                else:
+                    response = self._read_pages(
+                            self._client.service.readLists, list_filter)
                 for list_ in response:
                     self._cached_lists[list_.name] = list_
+                    self._cached_lists_by_id[list_.id] = list_
                 if not len(final_lists):
                     self._cached_all_lists = True
+                    self._store_metadata('lists', response)
             except WebFault as e:
                 raise BrontoError(e.message)
         else:
@@ -536,6 +911,18 @@ class Client(object):
         except:
             return list_
 
+    def get_lists_by_id(self, list_ids):
+        return self._get_by_ids(list_ids, self._cached_lists_by_id,
+                                self._cached_lists, 'mailListFilter',
+                                self._client.service.readLists)
+
+    def get_list_by_id(self, list_id):
+        list_ = self.get_lists_by_id([list_id, ])
+        try:
+            return list_[0]
+        except:
+            return list_
+
     def delete_lists(self, list_ids):
         lists = []
         for list_id in list_ids:
@@ -546,6 +933,7 @@ class Client(object):
             response = self._client.service.deleteLists(lists)
         except WebFault as e:
             raise BrontoError(e.message)
+        self._drop_metadata('lists')
         return response
 
     def delete_list(self, list_id):
@@ -556,16 +944,7 @@ class Client(object):
             return response.results
 
 
-    def add_contacts_to_list(self, list_, contacts):
-        """
-        The list must have either an id or a name defined.
-        The contacts must have either an id or an email defined.
-        >>> client.add_contacts_to_list({'id': 'xxx-xxx'},
-                [{id: 'yyy-yyy'}, {email: 'email2@example.com'}])
-        >>> client.add_contacts_to_list({'name': 'my_list'},
-                [{id: 'yyy-yyy'}, {email: 'email2@example.com'}])
-        >>>
-        """
+    def _construct_list_membership(self, list_, contacts):
         valid_list_attributes = ['id', 'name']
         valid_contact_attributes = ['id', 'email']
 
@@ -587,21 +966,31 @@ class Client(object):
                 if attribute in contact:
                     setattr(contact_obj, attribute, contact[attribute])
             final_contacts.append(contact_obj)
+        return final_list, final_contacts
+
+    def add_contacts_to_list(self, list_, contacts):
+        """
+        The list must have either an id or a name defined.
+        The contacts must have either an id or an email defined.
+        >>> client.add_contacts_to_list({'id': 'xxx-xxx'},
+                [{id: 'yyy-yyy'}, {email: 'email2@example.com'}])
+        >>> client.add_contacts_to_list({'name': 'my_list'},
+                [{id: 'yyy-yyy'}, {email: 'email2@example.com'}])
+        >>>
+        """
+        final_list, final_contacts = self._construct_list_membership(
+                list_, contacts)
         try:
             response = self._client.service.addToList(final_list,
                     final_contacts)
 
-            if hasattr(response, 'errors'):
-                err_str = ', '.join(['%s: %s' % (response.results[x].errorCode,
-                                                 response.results[x].errorString)
-                                     for x in response.errors])
-                raise BrontoError(
-                        'An error occurred while adding contacts to a list: %s'
-                        % err_str)
+            self._raise_for_errors(response, 'adding contacts to a list')
             # If no error we force to refresh the fields' cache
             self._cached_all_fields = False
         except WebFault as e:
             raise BrontoError(e.message)
+        finally:
+            self._invalidate_contacts(final_contacts)
         return response
 
     def add_contact_to_list(self, list_, contact):
@@ -615,8 +1004,37 @@ class Client(object):
         except:
             return request.results
 
+    def remove_contacts_from_list(self, list_, contacts):
+        """
+        The list and the contacts are given as for add_contacts_to_list.
+        >>> client.remove_contacts_from_list({'name': 'my_list'},
+                [{id: 'yyy-yyy'}, {email: 'email2@example.com'}])
+        >>>
+        """
+        final_list, final_contacts = self._construct_list_membership(
+                list_, contacts)
+        try:
+            response = self._client.service.removeFromList(final_list,
+                    final_contacts)
+            self._raise_for_errors(response, 'removing contacts from a list')
+        except WebFault as e:
+            raise BrontoError(e.message)
+        finally:
+            self._invalidate_contacts(final_contacts)
+        return response
+
+    def remove_contact_from_list(self, list_, contact):
+        """
+        Remove one contact from one list
+
+        """
+        request = self.remove_contacts_from_list(list_, [contact, ])
+        try:
+            return request.results[0]
+        except:
+            return request.results
+
     def get_messages(self, message_names=[]):
-        #TODO: Support search per message_id
         final_messages = []
         cached = []
         filter_operator = self._client.factory.create('filterOperator')
@@ -640,12 +1058,18 @@ class Client(object):
 
         if not self._cached_all_messages:
             try:
-                response = self._client.service.readMessages(message_filter,
-                                                             pageNumber=1)
+                if final_messages:
+                    response = self._client.service.readMessages(message_filter,
+                                                                 pageNumber=1)
+                else:
+                    response = self._read_pages(
+                            self._client.service.readMessages, message_filter)
                 for message in response:
                     self._cached_messages[message.name] = message
+                    self._cached_messages_by_id[message.id] = message
                 if not len(final_messages):
                     self._cached_all_messages = True
+                    self._store_metadata('messages', response)
             except WebFault as e:
                 raise BrontoError(e.message)
         else:
@@ -662,6 +1086,18 @@ class Client(object):
         except:
             return messages
 
+    def get_messages_by_id(self, message_ids):
+        return self._get_by_ids(message_ids, self._cached_messages_by_id,
+                                self._cached_messages, 'messageFilter',
+                                self._client.service.readMessages)
+
+    def get_message_by_id(self, message_id):
+        messages = self.get_messages_by_id([message_id, ])
+        try:
+            return messages[0]
+        except:
+            return messages
+
     def add_deliveries(self, deliveries):
         """
         >>> client.add_deliveries([{
@@ -694,29 +1130,18 @@ class Client(object):
 
         For more details: http://dev.bronto.com/api/v4/data-format
         """
-        required_attributes = ['start', 'messageId', 'type', 'fromEmail',
-                #'replyEmail', Even if the doc says so, it's not required
-                'fromName', 'recipients']
+        deliveries = list(deliveries)
+        self._validator('deliveryObject', 'delivery',
+                        DELIVERY_REQUIRED_ATTRIBUTES).validate(deliveries)
         final_deliveries = []
         for delivery in deliveries:
-            if not all(key in delivery for key in required_attributes):
-                raise ValueError('The attributes %s are required.'
-                                 % required_attributes)
             delivery_obj = self._client.factory.create('deliveryObject')
             for attribute, value in six.iteritems(delivery):
-                if attribute not in self._valid_delivery_fields:
-                    raise KeyError('Invalid list attribute: %s' % attribute)
-                else:
-                    setattr(delivery_obj, attribute, value)
+                setattr(delivery_obj, attribute, value)
             final_deliveries.append(delivery_obj)
         try:
             response = self._client.service.addDeliveries(final_deliveries)
-            if hasattr(response, 'errors'):
-                err_str = ', '.join(['%s: %s' % (response.results[x].errorCode,
-                                                 response.results[x].errorString)
-                                     for x in response.errors])
-                raise BrontoError('An error occurred while adding deliveries: %s'
-                                  % err_str)
+            self._raise_for_errors(response, 'adding deliveries')
         except WebFault as e:
             raise BrontoError(e.message)
         return response
@@ -727,3 +1152,85 @@ class Client(object):
             return request.results[0]
         except:
             return request.results
+
+    def get_deliveries(self, start=None, status=None, message_ids=None,
+                       include_recipients=False, page_number=1):
+        """
+        Read one page of deliveries, optionally only those starting after
+        ``start`` (a datetime), with the given status or for the given
+        message ids.
+        """
+        filter_operator = self._client.factory.create('filterOperator')
+        delivery_filter = self._client.factory.create('deliveryFilter')
+        filter_type = self._client.factory.create('filterType')
+        delivery_filter.type = filter_type.AND
+        if start is not None:
+            start_value = self._client.factory.create('dateValue')
+            start_value.operator = filter_operator.After
+            start_value.value = format_date(start)
+            delivery_filter.start = [start_value, ]
+        if status:
+            delivery_filter.status = status
+        if message_ids:
+            delivery_filter.messageId = list(message_ids)
+        try:
+            response = self._client.service.readDeliveries(
+                    delivery_filter, includeRecipients=include_recipients,
+                    pageNumber=page_number)
+        except WebFault as e:
+            raise BrontoError(e.message)
+        return response
+
+    def iter_deliveries(self, start=None, status=None, message_ids=None,
+                        include_recipients=False):
+        """
+        Yield every delivery matching the filters of get_deliveries.
+        """
+        page_number = 1
+        while True:
+            deliveries = self.get_deliveries(start, status, message_ids,
+                                             include_recipients, page_number)
+            if not deliveries:
+                break
+            for delivery in deliveries:
+                yield delivery
+            page_number += 1
+
+    def _iter_recent_activities(self, direction, start, size, types):
+        request = self._client.factory.create(
+                'recent%sActivitySearchRequest' % direction)
+        request.start = format_date(start)
+        request.size = size
+        if types:
+            request.types = list(types)
+        request.readDirection = 'FIRST'
+        method = getattr(self._client.service,
+                         'readRecent%sActivities' % direction)
+        while True:
+            try:
+                activities = method(request)
+            except WebFault as e:
+                raise BrontoError(e.message)
+            if not activities:
+                break
+            for activity in activities:
+                yield activity
+            request.readDirection = 'NEXT'
+
+    def iter_recent_outbound_activities(self, start, size=1000, types=None):
+        """
+        Yield the outbound activities (sends, opens, clicks, bounces, ...)
+        recorded since ``start``, which Bronto limits to the last 7 days.
+        >>> for activity in client.iter_recent_outbound_activities(
+                    datetime.utcnow() - timedelta(hours=1),
+                    types=['open', 'click']):
+        >>>     ...
+        """
+        return self._iter_recent_activities('Outbound', start, size, types)
+
+    def iter_recent_inbound_activities(self, start, size=1000, types=None):
+        """
+        Yield the inbound activities (web form submissions, conversions,
+        unsubscribes, ...) recorded since ``start``.
+        """
+        return self._iter_recent_activities('Inbound', start, size, types)
@@ -0,0 +1,194 @@
+"""
+Batched, concurrent transactional deliveries.
+
+>>> from bronto.deliveries import DeliveryQueue
+>>> with DeliveryQueue(client, fromEmail='shop@domain.com',
+                       fromName='The Shop') as deliveries:
+>>>     future = deliveries.send('password_reset', [contact.id],
+                                 {'link': reset_link})
+>>> future.result().id
+
+Deliveries sent within ``linger`` seconds of each other are coalesced into
+a single ``addDeliveries`` call of up to ``batch_size`` deliveries. Batches
+go through the client's worker pool, so several can be in flight at once.
+"""
+import threading
+import time
+from datetime import datetime
+
+import six
+from six.moves import queue
+from concurrent.futures import Future, wait
+
+from bronto.client import DELIVERY_REQUIRED_ATTRIBUTES, BrontoError
+from bronto.utils import format_date
+
+
+def _send_batch(client, batch):
+    try:
+        try:
+            response = client.add_deliveries([x for x, y in batch])
+        except BrontoError as e:
+            if e.response is None:
+                raise
+            response = e.response
+    except Exception as e:
+        for delivery, future in batch:
+            future.set_exception(e)
+        return
+    results = list(getattr(response, 'results', None) or [])
+    for (delivery, future), result in zip(batch, results):
+        if getattr(result, 'isError', False):
+            future.set_exception(BrontoError('%s: %s' % (result.errorCode,
+                                                         result.errorString),
+                                             result))
+        else:
+            future.set_result(result)
+    for delivery, future in batch[len(results):]:
+        future.set_exception(BrontoError('No result for this delivery.'))
+
+
+class DeliveryQueue(object):
+    """
+    Keyword arguments are used as defaults for every delivery, e.g.
+    ``fromEmail``, ``fromName`` or ``replyEmail``. Deliveries are
+    ``transactional`` and start immediately unless told otherwise.
+    """
+
+    def __init__(self, client, batch_size=100, linger=0.05, **defaults):
+        self.client = client
+        self.batch_size = batch_size
+        self.linger = linger
+        self.defaults = defaults
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._message_ids = {}
+        self._batches = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def message_id(self, message):
+        """
+        Resolve a message name or id to its id, through the client's message
+        cache.
+        """
+        try:
+            return self._message_ids[message]
+        except KeyError:
+            pass
+        if message in self.client._cached_messages_by_id:
+            message_id = message
+        else:
+            found = self.client.get_message(message) or \
+                self.client.get_message_by_id(message)
+            if not found:
+                raise BrontoError('Message not found: %s' % message)
+            message_id = found.id
+        self._message_ids[message] = message_id
+        return message_id
+
+    def _recipient(self, recipient):
+        if isinstance(recipient, six.string_types):
+            return {'type': 'contact', 'id': recipient}
+        return recipient
+
+    def _fields(self, fields):
+        if isinstance(fields, dict):
+            return [{'name': name, 'type': 'html', 'content': content}
+                    for name, content in six.iteritems(fields)]
+        return list(fields)
+
+    def send(self, message, recipients, fields=None, **delivery):
+        """
+        Queue a delivery of ``message`` (a name or an id) and return a Future
+        for its result. ``recipients`` may be contact ids or recipient dicts,
+        ``fields`` a dict of name to content or a list of field dicts.
+        """
+        final_delivery = dict(self.defaults)
+        final_delivery.update(delivery)
+        final_delivery['messageId'] = self.message_id(message)
+        final_delivery['recipients'] = [self._recipient(x)
+                                        for x in recipients]
+        if fields:
+            final_delivery['fields'] = self._fields(fields)
+        final_delivery.setdefault('type', 'transactional')
+        if 'start' not in final_delivery:
+            final_delivery['start'] = format_date(datetime.utcnow())
+        future = Future()
+        try:
+            # A single invalid delivery would make its whole batch fail.
+            self.client._validator('deliveryObject', 'delivery',
+                                   DELIVERY_REQUIRED_ATTRIBUTES).validate(
+                                       [final_delivery])
+        except (KeyError, ValueError) as e:
+            future.set_exception(e)
+            return future
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put((final_delivery, future))
+        return future
+
+    def _run(self):
+        # Without a worker pool batches are sent from this thread, which
+        # needs a client of its own.
+        client = self.client
+        if not client._max_workers or client._max_workers < 2:
+            client = client.clone()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item, ]
+            deadline = time.time() + self.linger
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(
+                        timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                future = client._submit(_send_batch, batch)
+            except Exception as e:
+                # E.g. a worker pool shut down: fail the batch, not the
+                # thread every later delivery is waiting on.
+                for delivery, delivery_future in batch:
+                    delivery_future.set_exception(e)
+            else:
+                self._batches.add(future)
+                future.add_done_callback(self._batches.discard)
+            for x in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """
+        Block until every delivery queued so far has been sent.
+        """
+        self._queue.join()
+        wait(list(self._batches))
+
+    def close(self):
+        """
+        Send the remaining deliveries and stop the background thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+        wait(list(self._batches))
@@ -0,0 +1,166 @@
+"""
+Adaptive concurrency and circuit breaking for service calls.
+
+>>> from bronto.dispatch import CircuitOpenError, Dispatcher
+>>> client = Client('BRONTO_API_TOKEN', max_workers=32,
+                    dispatcher=Dispatcher(max_limit=32))
+>>> try:
+>>>     client.add_or_update_contacts(contacts)
+>>> except CircuitOpenError:
+>>>     retry_later(contacts)
+
+Every request the client (and all its clones) sends goes through the
+dispatcher, which allows at most ``limit`` of them in flight at once. The
+limit grows by about one for every ``limit`` successful requests and is
+halved when a response is slower than ``latency_target`` seconds, when a
+request times out, or when Bronto answers with a throttling or server error
+(additive increase, multiplicative decrease). ``max_workers`` only bounds
+how many requests can be waiting for the dispatcher.
+
+After ``failure_threshold`` such failures in a row the circuit opens: for
+``reset_timeout`` seconds every request fails at once with
+CircuitOpenError, then a single request is let through, closing the circuit
+if it succeeds and opening it again if not.
+"""
+import io
+import re
+import threading
+import time
+
+from suds.transport import TransportError
+from suds.transport.https import HttpAuthenticated
+
+from bronto.client import BrontoError
+from bronto.transport import _SharedTransport
+
+# HTTP statuses telling that Bronto is overloaded rather than that the
+# request was wrong.
+OVERLOAD_STATUSES = frozenset([429, 502, 503, 504])
+
+# Faults (sent with a 500 status) that mean the same.
+_overload_fault = re.compile(br'<faultstring>[^<]*(too many|throttl|rate limit'
+                             br'|temporarily unavailable|try again)',
+                             re.IGNORECASE)
+
+
+class CircuitOpenError(BrontoError):
+    """
+    Raised without sending the request while Bronto is considered down.
+    """
+
+
+class Dispatcher(object):
+    """
+    Shared by every thread sending requests; see the module documentation.
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64,
+                 latency_target=10, backoff=0.5, failure_threshold=5,
+                 reset_timeout=30):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.in_flight = 0
+        self._failures = 0
+        self._opened = None
+        self._trial = False
+        self._decreased = 0
+        self._condition = threading.Condition()
+
+    @property
+    def state(self):
+        with self._condition:
+            if self._opened is None:
+                return 'closed'
+            if time.time() - self._opened < self.reset_timeout:
+                return 'open'
+            return 'half-open'
+
+    def acquire(self):
+        """
+        Wait for a free slot and return the time the request starts. Raise
+        CircuitOpenError if the circuit is open.
+        """
+        with self._condition:
+            while True:
+                if self._opened is not None:
+                    remaining = self._opened + self.reset_timeout - time.time()
+                    if remaining > 0 or self._trial:
+                        raise CircuitOpenError(
+                            'Bronto keeps failing, not sending requests for '
+                            'another %d seconds.' % max(remaining, 0))
+                    self._trial = True
+                    break
+                if self.in_flight < int(self.limit):
+                    break
+                self._condition.wait()
+            self.in_flight += 1
+            return time.time()
+
+    def _decrease(self, started, now):
+        # Responses to requests sent before the last decrease reflect the
+        # old limit; only the first of them should lower it.
+        if started > self._decreased:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            self._decreased = now
+
+    def release(self, started, overloaded=False):
+        """
+        Record the outcome of a request started at ``started``.
+        """
+        now = time.time()
+        with self._condition:
+            self.in_flight -= 1
+            self._trial = False
+            if overloaded:
+                self._failures += 1
+                if self._opened is not None or \
+                        self._failures >= self.failure_threshold:
+                    self._opened = now
+                self._decrease(started, now)
+            else:
+                self._failures = 0
+                self._opened = None
+                if now - started > self.latency_target:
+                    self._decrease(started, now)
+                elif self.in_flight + 1 >= int(self.limit):
+                    # Only grow a limit that is actually being used.
+                    self.limit = min(self.max_limit,
+                                     self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+class DispatchTransport(_SharedTransport):
+    """
+    suds transport sending requests through ``transport`` (a regular suds
+    HTTP transport by default) under the control of ``dispatcher``.
+    """
+
+    def __init__(self, dispatcher, transport=None):
+        _SharedTransport.__init__(self)
+        self.dispatcher = dispatcher
+        self.transport = transport or HttpAuthenticated()
+        self.options = self.transport.options
+
+    def open(self, request):
+        return self.transport.open(request)
+
+    def send(self, request):
+        started = self.dispatcher.acquire()
+        overloaded = True
+        try:
+            reply = self.transport.send(request)
+            overloaded = False
+            return reply
+        except TransportError as e:
+            body = e.fp.read() if e.fp else b''
+            overloaded = (e.httpcode in OVERLOAD_STATUSES or
+                          bool(_overload_fault.search(body)))
+            raise TransportError(e.args[0] if e.args else '', e.httpcode,
+                                 io.BytesIO(body))
+        finally:
+            self.dispatcher.release(started, overloaded)
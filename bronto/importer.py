@@ -0,0 +1,265 @@
+"""
+Streaming bulk import of contacts from CSV or NDJSON files.
+
+>>> from bronto.client import Client
+>>> from bronto.importer import ContactImporter
+>>> client = Client('BRONTO_API_TOKEN', max_workers=4)
+>>> client.login()
+>>> importer = ContactImporter(client,
+        mapping={'E-mail': 'email', 'First Name': 'firstname'},
+        results='contacts.results.csv',
+        checkpoint='contacts.checkpoint')
+>>> importer.import_file('contacts.csv')
+{'imported': 9998, 'failed': 2, 'skipped': 0}
+"""
+import csv
+import io
+import json
+import os
+import time
+
+import six
+
+from bronto.client import BrontoError
+from bronto.utils import write_atomic
+
+
+def read_csv(path):
+    """
+    Lazily yield ``(row_number, row)`` for every record of a CSV file with a
+    header line. Row numbers start at 1 for the first record.
+    """
+    if six.PY2:
+        handle = open(path, 'rb')
+    else:
+        handle = io.open(path, newline='', encoding='utf-8')
+    with handle:
+        for row_number, row in enumerate(csv.DictReader(handle), 1):
+            yield row_number, row
+
+
+def read_ndjson(path):
+    """
+    Lazily yield ``(row_number, row)`` for every JSON object of a
+    newline-delimited JSON file. Blank lines are ignored but still counted.
+    """
+    with io.open(path, encoding='utf-8') as handle:
+        for row_number, line in enumerate(handle, 1):
+            line = line.strip()
+            if line:
+                yield row_number, json.loads(line)
+
+
+class ContactImporter(object):
+    """
+    Stream records into ``Client.add_or_update_contacts``.
+
+    ``mapping`` translates source columns to contact attributes (those of
+    the ``contactObject`` schema type) or to custom field names; unmapped
+    columns are used as-is. Custom fields are checked once against
+    ``Client.get_fields`` before anything is sent.
+
+    Batches of ``batch_size`` rows are dispatched through the client's worker
+    pool (``Client(token, max_workers=N)``) and retried up to ``retries``
+    times when the call fails for a transient reason (the network, a time
+    out, an HTTP error or an open circuit); a batch Bronto answers with a
+    fault is failed at once. Every row gets a line in the
+    ``results`` CSV file, and ``checkpoint`` records the last row below which
+    everything has been processed, so an interrupted import can be resumed
+    by running it again with the same checkpoint.
+    """
+    list_separator = ','
+    result_columns = ['row', 'id', 'isNew', 'errorCode', 'errorString']
+
+    def __init__(self, client, mapping=None, batch_size=100, retries=3,
+                 retry_delay=1.0, results=None, checkpoint=None):
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer.')
+        self.client = client
+        self.mapping = mapping or {}
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.results = results
+        self.checkpoint = checkpoint
+        self._checked_fields = set()
+        self._validator = None
+
+    def import_file(self, path, format=None):
+        """
+        Import a ``.csv`` or ``.ndjson``/``.jsonl`` file. ``format`` may be
+        given explicitly as ``'csv'`` or ``'ndjson'``.
+        """
+        if format is None:
+            format = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+        if format == 'csv':
+            rows = read_csv(path)
+        elif format == 'ndjson':
+            rows = read_ndjson(path)
+        else:
+            raise ValueError('Unsupported import format: %s' % format)
+        return self.import_rows(rows)
+
+    def import_rows(self, rows):
+        """
+        Import an iterable of ``(row_number, row)`` pairs, where row numbers
+        are strictly increasing. Returns a dict of counters.
+        """
+        stats = {'imported': 0, 'failed': 0, 'skipped': 0}
+        resume_after = self._read_checkpoint()
+        result_file = None
+        if self.results:
+            exists = os.path.exists(self.results) and resume_after
+            result_file = open(self.results, 'a' if exists else 'w')
+            writer = csv.writer(result_file)
+            if not exists:
+                writer.writerow(self.result_columns)
+        else:
+            writer = None
+
+        # Batches finish out of order, so the checkpoint only moves past a
+        # batch once every batch before it has finished too.
+        pending = []
+        finished = set()
+        in_flight = []
+        max_in_flight = 2 * max(self.client._max_workers or 1, 1)
+
+        def collect(wait_all):
+            while in_flight and (wait_all or len(in_flight) >= max_in_flight
+                                 or in_flight[0][1].done()):
+                first_row, future = in_flight.pop(0)
+                for row_number, is_error, result in future.result():
+                    if writer is not None:
+                        writer.writerow([row_number] + result)
+                    stats['failed' if is_error else 'imported'] += 1
+                finished.add(first_row)
+            while pending and pending[0][0] in finished:
+                finished.discard(pending[0][0])
+                last_row = pending.pop(0)[1]
+                if result_file is not None:
+                    result_file.flush()
+                if self.checkpoint:
+                    write_atomic(self.checkpoint, str(last_row))
+
+        try:
+            for batch in self._batches(rows, resume_after, stats, writer):
+                pending.append((batch[0][0], batch[-1][0]))
+                in_flight.append((batch[0][0],
+                                  self.client._submit(self._send, batch)))
+                collect(False)
+            collect(True)
+        finally:
+            if result_file is not None:
+                result_file.close()
+        return stats
+
+    def _read_checkpoint(self):
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as handle:
+                return int(handle.read().strip() or 0)
+        return 0
+
+    def _batches(self, rows, resume_after, stats, writer):
+        batch = []
+        for row_number, row in rows:
+            if row_number <= resume_after:
+                stats['skipped'] += 1
+                continue
+            try:
+                contact = self.map_row(row)
+            except (KeyError, ValueError) as e:
+                stats['failed'] += 1
+                if writer is not None:
+                    writer.writerow([row_number, '', '', 'invalid', str(e)])
+                continue
+            batch.append((row_number, contact))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def map_row(self, row):
+        """
+        Turn one source record into a contact dict accepted by
+        ``Client.add_or_update_contacts``, raising KeyError or ValueError if
+        Bronto would refuse it. Empty values are dropped so they don't
+        overwrite existing data.
+        """
+        if self._validator is None:
+            self._validator = self.client._validator('contactObject',
+                                                     'contact')
+        contact = {}
+        fields = {}
+        for column, value in six.iteritems(row):
+            if value is None or value == '':
+                continue
+            name = self.mapping.get(column, column)
+            if name in ('listIds', 'SMSKeywordIDs') and \
+                    isinstance(value, six.string_types):
+                contact[name] = [x.strip() for x in
+                                 value.split(self.list_separator) if x.strip()]
+            elif name in self._validator.attributes:
+                contact[name] = value
+            else:
+                fields[name] = value
+        if fields:
+            self._check_fields(fields)
+            contact['fields'] = fields
+        if not any([contact.get('id'), contact.get('email'),
+                    contact.get('mobileNumber')]):
+            raise ValueError('Must provide one of: id, email, mobileNumber')
+        # A single invalid contact would make the whole batch fail.
+        self._validator.validate([contact])
+        return contact
+
+    def _check_fields(self, fields):
+        unknown = set(fields) - self._checked_fields
+        if not unknown:
+            return
+        known = set(x.name for x in self.client.get_fields())
+        missing = unknown - known
+        if missing:
+            raise ValueError('Invalid contactField: %s'
+                             % ', '.join(sorted(missing)))
+        self._checked_fields.update(unknown)
+
+    def _failed(self, batch, error):
+        return [(row_number, True, ['', '', 'failed', str(error)])
+                for row_number, contact in batch]
+
+    def _send(self, client, batch):
+        from bronto.dispatch import CircuitOpenError
+        contacts = [contact for row_number, contact in batch]
+        attempt = 0
+        while True:
+            try:
+                response = client.add_or_update_contacts(contacts)
+                break
+            except BrontoError as e:
+                if e.response is not None:
+                    response = e.response
+                    break
+                if not isinstance(e, CircuitOpenError):
+                    # A fault: sending the same batch again would fail again.
+                    return self._failed(batch, e)
+                error = e
+            except (KeyError, ValueError) as e:
+                return self._failed(batch, e)
+            except Exception as e:
+                # The network, a time out, or an HTTP error status, for which
+                # suds raises a plain Exception.
+                error = e
+            if attempt >= self.retries:
+                return self._failed(batch, error)
+            attempt += 1
+            time.sleep(self.retry_delay * 2 ** (attempt - 1))
+        results = []
+        for (row_number, contact), result in zip(batch, response.results):
+            if getattr(result, 'isError', False):
+                results.append((row_number, True, ['', '', result.errorCode,
+                                                   result.errorString]))
+            else:
+                results.append((row_number, False,
+                                [result.id, result.isNew, '', '']))
+        return results
@@ -0,0 +1,133 @@
+"""
+Streaming order ingestion.
+
+>>> from bronto.orders import OrderPipeline
+>>> for result in OrderPipeline(client).process(order_events()):
+>>>     if result.error:
+>>>         log.warning('Order %s failed: %s', result.order_id, result.error)
+
+Orders are collected into batches of ``batch_size`` distinct order ids.
+When an order id shows up again before its batch is sent, the later version
+replaces the earlier one, so a stream with several updates per order costs
+one write per order and batch. Batches run concurrently through the
+client's worker pool, except that a batch writing an order still being
+written by an earlier batch waits for that one to finish. A batch that
+fails for a transient reason (the network, a time out, an HTTP error) is
+sent again up to ``retries`` times; if it still fails, each of its orders
+gets an OrderResult with the error.
+"""
+import time
+from collections import namedtuple
+
+from bronto.client import BrontoError
+
+# ``error`` is None when the order was written, and ``updates`` is how many
+# versions of the order were merged into the write.
+OrderResult = namedtuple('OrderResult', ['order_id', 'error', 'updates'])
+
+
+class OrderPipeline(object):
+
+    def __init__(self, client, batch_size=100, retries=3, retry_delay=1.0):
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer.')
+        self.client = client
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def validate(self, order):
+        """
+        Raise ValueError or KeyError, as ``Client.add_orders`` does, for an
+        order that Bronto would refuse.
+        """
+        if not order.get('id', None):
+            raise ValueError('Each order must provide an id')
+        self.client._validator('orderObject', 'order').validate([order])
+
+    def process(self, orders):
+        """
+        Write an iterable of order dicts, yielding an OrderResult for every
+        distinct order of every batch, plus one for every invalid order.
+        """
+        batch = {}
+        updates = {}
+        in_flight = []
+        max_in_flight = 2 * max(self.client._max_workers or 1, 1)
+        for order in orders:
+            try:
+                self.validate(order)
+            except (KeyError, ValueError) as e:
+                yield OrderResult(order.get('id'), e.args[0], 1)
+                continue
+            order_id = order['id']
+            batch[order_id] = order
+            updates[order_id] = updates.get(order_id, 0) + 1
+            if len(batch) >= self.batch_size:
+                for result in self._dispatch(in_flight, batch, updates):
+                    yield result
+                batch = {}
+                updates = {}
+                while in_flight and (len(in_flight) >= max_in_flight or
+                                     in_flight[0][1].done()):
+                    for result in in_flight.pop(0)[1].result():
+                        yield result
+        if batch:
+            for result in self._dispatch(in_flight, batch, updates):
+                yield result
+        for order_ids, future in in_flight:
+            for result in future.result():
+                yield result
+
+    def _dispatch(self, in_flight, batch, updates):
+        """
+        Submit a batch, first waiting for the batches in flight that write
+        one of its orders, so an older version of an order can't overwrite a
+        newer one. Yields the results of the batches waited for.
+        """
+        order_ids = frozenset(batch)
+        waits = 0
+        for position, (sent_ids, future) in enumerate(in_flight, 1):
+            if sent_ids & order_ids:
+                waits = position
+        for x in range(waits):
+            for result in in_flight.pop(0)[1].result():
+                yield result
+        in_flight.append((order_ids, self.client._submit(self._send, batch,
+                                                         updates)))
+
+    def _send(self, client, batch, updates):
+        from bronto.dispatch import CircuitOpenError
+        order_ids = list(batch)
+        attempt = 0
+        while True:
+            try:
+                response = client.add_orders([batch[x] for x in order_ids])
+                break
+            except BrontoError as e:
+                if e.response is not None:
+                    response = e.response
+                    break
+                if not isinstance(e, CircuitOpenError):
+                    # A fault: sending the same batch again would fail again.
+                    return [OrderResult(x, str(e), updates[x])
+                            for x in order_ids]
+                error = e
+            except (KeyError, ValueError) as e:
+                return [OrderResult(x, str(e), updates[x]) for x in order_ids]
+            except Exception as e:
+                # The network, a time out, or an HTTP error status, for which
+                # suds raises a plain Exception.
+                error = e
+            if attempt >= self.retries:
+                return [OrderResult(x, str(error), updates[x])
+                        for x in order_ids]
+            attempt += 1
+            time.sleep(self.retry_delay * 2 ** (attempt - 1))
+        results = []
+        for order_id, result in zip(order_ids, response.results):
+            error = None
+            if getattr(result, 'isError', False):
+                error = '%s: %s' % (result.errorCode, result.errorString)
+            results.append(OrderResult(order_id, error, updates[order_id]))
+        return results
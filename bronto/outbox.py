@@ -0,0 +1,328 @@
+"""
+Durable outbox for contact, order and delivery writes.
+
+>>> from bronto.outbox import Outbox
+>>> outbox = Outbox('/var/spool/bronto-outbox.db')
+>>> outbox.put('contacts', {'email': 'me@domain.com'})
+>>> outbox.put_many('orders', orders)
+>>> outbox.start(client)    # or outbox.drain(client) from a cron job
+>>> ...
+>>> outbox.stop()
+
+Writes are committed to an SQLite file before ``put`` returns and are sent
+to Bronto later, in batches, by ``drain``. A batch that fails as a whole (a
+fault, a time out, the network) is retried with an exponential back off; a
+record that Bronto rejects, or that is checked against the WSDL schema and
+the account's contact fields and found invalid before sending, is kept with
+its error, see ``failed``.
+
+Batches being sent are leased for ``lease`` seconds. If the process sending
+them dies, the lease runs out and the next ``drain``, in this process or
+another one, sends them again. Delivery is therefore at least once: records
+whose batch was accepted just before a crash can be sent twice, which is
+harmless for contacts and orders (both are added or updated) but sends a
+delivery twice.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from bronto.client import DELIVERY_REQUIRED_ATTRIBUTES, BrontoError
+from bronto.utils import format_date
+
+# Client method writing each kind of record.
+OPERATIONS = {
+    'contacts': 'add_or_update_contacts',
+    'orders': 'add_orders',
+    'deliveries': 'add_deliveries',
+}
+
+# Schema type, name and required attributes of each kind of record.
+SCHEMA_TYPES = {
+    'contacts': ('contactObject', 'contact', ()),
+    'orders': ('orderObject', 'order', ()),
+    'deliveries': ('deliveryObject', 'delivery', DELIVERY_REQUIRED_ATTRIBUTES),
+}
+
+
+def _default(value):
+    if hasattr(value, 'strftime'):
+        return format_date(value)
+    raise TypeError('%r is not JSON serializable' % (value, ))
+
+
+class Outbox(object):
+    """
+    ``max_attempts`` is how many times a batch is sent before its records
+    are marked as failed, and ``retry_delay`` the wait after the first
+    failed attempt, doubled after every following one.
+    """
+
+    def __init__(self, path, batch_size=100, max_attempts=5, retry_delay=30,
+                 lease=300):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'operation TEXT, record TEXT, failed INTEGER, '
+                         'attempts INTEGER, available REAL, error TEXT)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS outbox_available ON '
+                         'outbox (failed, operation, available)')
+
+    def put_many(self, operation, records):
+        """
+        Store records to be written with the given operation, one of
+        ``contacts``, ``orders`` or ``deliveries``.
+        """
+        if operation not in OPERATIONS:
+            raise ValueError('Invalid operation: %s' % operation)
+        now = time.time()
+        rows = [(operation, json.dumps(x, default=_default), now)
+                for x in records]
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.executemany('INSERT INTO outbox (operation, record, '
+                                     'failed, attempts, available) VALUES '
+                                     '(?, ?, 0, 0, ?)', rows)
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+        return len(rows)
+
+    def put(self, operation, record):
+        self.put_many(operation, [record])
+
+    def _claim(self, operation):
+        """
+        Lease the oldest records of ``operation`` that are due, returning a
+        list of ``(id, attempts, record)``.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._db.execute(
+                    'SELECT id, attempts, record FROM outbox WHERE failed = 0 '
+                    'AND operation = ? AND available <= ? ORDER BY id '
+                    'LIMIT ?', (operation, now, self.batch_size)).fetchall()
+                self._db.executemany(
+                    'UPDATE outbox SET available = ? WHERE id = ?',
+                    [(now + self.lease, x[0]) for x in rows])
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+        return [(x[0], x[1], json.loads(x[2])) for x in rows]
+
+    def _execute_many(self, statement, rows):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.executemany(statement, rows)
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def _retry(self, batch, error):
+        from bronto.dispatch import CircuitOpenError
+        now = time.time()
+        if isinstance(error, CircuitOpenError):
+            # Nothing was sent: try again later, without using an attempt.
+            self._execute_many('UPDATE outbox SET available = ?, error = ? '
+                               'WHERE id = ?',
+                               [(now + self.retry_delay, str(error), x[0])
+                                for x in batch])
+            return
+        rows = []
+        for row_id, attempts, record in batch:
+            attempts += 1
+            available = now + self.retry_delay * 2 ** (attempts - 1)
+            rows.append((int(attempts >= self.max_attempts), attempts,
+                         available, str(error), row_id))
+        self._execute_many('UPDATE outbox SET failed = ?, attempts = ?, '
+                           'available = ?, error = ? WHERE id = ?', rows)
+
+    def _check(self, client, operation, batch):
+        """
+        Split a claimed batch into the records to send and ``(error, id)``
+        for those the client or Bronto would refuse, as any of them would
+        make the whole batch fail.
+        """
+        type_name, name, required = SCHEMA_TYPES[operation]
+        validator = client._validator(type_name, name, required)
+        known_fields = None
+        valid = []
+        invalid = []
+        for row_id, attempts, record in batch:
+            try:
+                validator.validate([record])
+                if operation == 'contacts':
+                    if not any([record.get('id'), record.get('email'),
+                                record.get('mobileNumber')]):
+                        raise ValueError('Must provide one of: id, email, '
+                                         'mobileNumber')
+                    if record.get('fields'):
+                        if known_fields is None:
+                            known_fields = set(x.name for x in
+                                               client.get_fields())
+                        unknown = set(record['fields']) - known_fields
+                        if unknown:
+                            raise ValueError('Invalid contactField: %s'
+                                             % ', '.join(sorted(unknown)))
+                elif operation == 'orders' and not record.get('id'):
+                    raise ValueError('Each order must provide an id')
+            except (KeyError, ValueError) as e:
+                invalid.append((e.args[0], row_id))
+            else:
+                valid.append((row_id, attempts, record))
+        return valid, invalid
+
+    def _send(self, client, operation, batch):
+        """
+        Send one claimed batch. Returns ``(sent, failed, retried)``, the
+        number of records written, rejected and left to be sent again.
+        """
+        method = getattr(client, OPERATIONS[operation])
+        try:
+            batch, invalid = self._check(client, operation, batch)
+        except Exception as e:
+            # Reading the custom fields failed.
+            self._retry(batch, e)
+            return 0, 0, len(batch)
+        self._execute_many('UPDATE outbox SET failed = 1, error = ? '
+                           'WHERE id = ?', invalid)
+        if not batch:
+            return 0, len(invalid), 0
+        try:
+            try:
+                response = method([x[2] for x in batch])
+            except BrontoError as e:
+                if e.response is None:
+                    raise
+                response = e.response
+        except (KeyError, ValueError) as e:
+            # Refused by the client for a reason the checks missed: sending
+            # the same records again would be refused again.
+            self._execute_many('UPDATE outbox SET failed = 1, error = ? '
+                               'WHERE id = ?',
+                               [(e.args[0], x[0]) for x in batch])
+            return 0, len(invalid) + len(batch), 0
+        except Exception as e:
+            self._retry(batch, e)
+            return 0, len(invalid), len(batch)
+        sent = []
+        failed = []
+        for (row_id, attempts, record), result in zip(batch, response.results):
+            if getattr(result, 'isError', False):
+                failed.append(('%s: %s' % (result.errorCode,
+                                           result.errorString), row_id))
+            else:
+                sent.append((row_id, ))
+        self._execute_many('DELETE FROM outbox WHERE id = ?', sent)
+        self._execute_many('UPDATE outbox SET failed = 1, error = ? '
+                           'WHERE id = ?', failed)
+        return len(sent), len(invalid) + len(failed), 0
+
+    def drain(self, client):
+        """
+        Send every record that is due. Returns ``(sent, failed)``, the number
+        of records written and rejected.
+        """
+        sent = failed = 0
+        for operation in sorted(OPERATIONS):
+            while not self._stopped.is_set():
+                batch = self._claim(operation)
+                if not batch:
+                    break
+                batch_sent, batch_failed, retried = self._send(
+                    client, operation, batch)
+                sent += batch_sent
+                failed += batch_failed
+                if retried:
+                    # The batch will be retried later; don't spin on the
+                    # records behind it while Bronto is unavailable.
+                    break
+        return sent, failed
+
+    def pending(self):
+        """
+        Number of records waiting to be sent.
+        """
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM outbox '
+                                    'WHERE failed = 0').fetchone()[0]
+
+    def failed(self):
+        """
+        Yield ``(id, operation, record, error)`` for every failed record.
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT id, operation, record, error '
+                                    'FROM outbox WHERE failed = 1 '
+                                    'ORDER BY id').fetchall()
+        for row_id, operation, record, error in rows:
+            yield row_id, operation, json.loads(record), error
+
+    def retry_failed(self, ids=None):
+        """
+        Queue failed records again, all of them or only those in ``ids``.
+        """
+        if ids is None:
+            with self._lock:
+                ids = [x[0] for x in self._db.execute(
+                    'SELECT id FROM outbox WHERE failed = 1').fetchall()]
+        self._execute_many('UPDATE outbox SET failed = 0, attempts = 0, '
+                           'available = 0, error = NULL WHERE id = ?',
+                           [(x, ) for x in ids])
+
+    def discard_failed(self, ids=None):
+        if ids is None:
+            with self._lock:
+                self._db.execute('DELETE FROM outbox WHERE failed = 1')
+            return
+        self._execute_many('DELETE FROM outbox WHERE failed = 1 AND id = ?',
+                           [(x, ) for x in ids])
+
+    def start(self, client, interval=1):
+        """
+        Drain the outbox from a background thread every ``interval`` seconds,
+        with a clone of ``client`` so the caller can go on using it.
+        """
+        if self._thread is not None:
+            raise RuntimeError('The outbox is already being drained.')
+        self._stopped.clear()
+        client = client.clone()
+
+        def run():
+            while not self._stopped.is_set():
+                self.drain(client)
+                self._stopped.wait(interval)
+
+        self._thread = threading.Thread(target=run, name='bronto-outbox')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background drainer, letting the batch in flight finish.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stopped.clear()
+
+    def close(self):
+        self.stop()
+        self._db.close()
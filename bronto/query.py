@@ -0,0 +1,132 @@
+"""
+Composable contact queries compiled into a single ``contactFilter``.
+
+>>> from bronto.query import ContactQuery
+>>> query = (ContactQuery()
+             .email('EndsWith', '@example.com')
+             .list_id(my_list.id)
+             .status('active')
+             .modified('After', datetime(2015, 1, 1))
+             .field('firstname', 'Joey'))
+>>> for contact in client.find_contacts(query):
+>>>     ...
+
+Every criterion except ``field`` is sent to Bronto. ``contactFilter`` has
+no way to select on custom field values, so ``field`` criteria are checked
+on the returned contacts, which are read with those fields included.
+"""
+import six
+
+from bronto.utils import format_date
+
+FILTER_OPERATORS = frozenset([
+    'EqualTo', 'NotEqualTo', 'StartsWith', 'EndsWith', 'DoesNotStartWith',
+    'DoesNotEndWith', 'GreaterThan', 'LessThan', 'GreaterThanEqualTo',
+    'LessThanEqualTo', 'Contains', 'DoesNotContain', 'SameYear',
+    'NotSameYear', 'SameDay', 'NotSameDay', 'Before', 'After',
+    'BeforeOrSameDay', 'AfterOrSameDay',
+])
+
+
+class ContactQuery(object):
+    """
+    Criteria are AND'ed together, or OR'ed with ``ContactQuery('OR')``.
+    Field criteria always have to match in addition to the others.
+    """
+    _string_criteria = ('email', 'mobileNumber')
+    _date_criteria = ('created', 'modified')
+
+    def __init__(self, type='AND'):
+        if type not in ('AND', 'OR'):
+            raise ValueError('The query type must be either AND or OR.')
+        self.type = type
+        self.criteria = {}
+        self.fields = []
+
+    def _add(self, attribute, value):
+        self.criteria.setdefault(attribute, []).append(value)
+        return self
+
+    def _operator(self, operator):
+        if operator not in FILTER_OPERATORS:
+            raise ValueError('Invalid filter operator: %s' % operator)
+        return operator
+
+    def email(self, operator, value):
+        return self._add('email', (self._operator(operator), value))
+
+    def mobile_number(self, operator, value):
+        return self._add('mobileNumber', (self._operator(operator), value))
+
+    def created(self, operator, value):
+        return self._add('created', (self._operator(operator), value))
+
+    def modified(self, operator, value):
+        return self._add('modified', (self._operator(operator), value))
+
+    def _add_values(self, attribute, values):
+        if isinstance(values, six.string_types):
+            values = [values, ]
+        for value in values:
+            self._add(attribute, value)
+        return self
+
+    def id(self, ids):
+        return self._add_values('id', ids)
+
+    def status(self, statuses):
+        return self._add_values('status', statuses)
+
+    def list_id(self, list_ids):
+        return self._add_values('listId', list_ids)
+
+    def segment_id(self, segment_ids):
+        return self._add_values('segmentId', segment_ids)
+
+    def sms_keyword_id(self, keyword_ids):
+        return self._add_values('SMSKeywordID', keyword_ids)
+
+    def msg_pref(self, prefs):
+        return self._add_values('msgPref', prefs)
+
+    def field(self, name, value):
+        """
+        Only keep contacts whose custom field ``name`` equals ``value``.
+        """
+        self.fields.append((name, value))
+        return self
+
+    def compile(self, factory):
+        """
+        Build the ``contactFilter`` for a suds factory.
+        """
+        filter_operator = factory.create('filterOperator')
+        filter_type = factory.create('filterType')
+        contact_filter = factory.create('contactFilter')
+        contact_filter.type = getattr(filter_type, self.type)
+        for attribute, values in six.iteritems(self.criteria):
+            if attribute in self._string_criteria + self._date_criteria:
+                value_type = ('dateValue' if attribute in self._date_criteria
+                              else 'stringValue')
+                final_values = []
+                for operator, value in values:
+                    value_obj = factory.create(value_type)
+                    value_obj.operator = getattr(filter_operator, operator)
+                    value_obj.value = format_date(value)
+                    final_values.append(value_obj)
+                setattr(contact_filter, attribute, final_values)
+            else:
+                setattr(contact_filter, attribute, list(values))
+        return contact_filter
+
+    def match(self, contact, field_names):
+        """
+        Check the field criteria against a contact. ``field_names`` maps
+        field ids to field names.
+        """
+        if not self.fields:
+            return True
+        contents = dict((field_names.get(x.fieldId), x.content)
+                        for x in getattr(contact, 'fields', None) or [])
+        return all(contents.get(name) == six.text_type(value)
+                   for name, value in self.fields)
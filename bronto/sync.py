@@ -0,0 +1,78 @@
+"""
+Incremental "changed since" synchronisation of contacts.
+
+>>> from bronto.sync import ContactSync
+>>> sync = ContactSync(client, 'contacts.sync')
+>>> for contact in sync.changes():
+>>>     reconcile(contact)
+
+Only contacts modified since the previous complete run are read. The high
+water mark is the latest ``modified`` date seen, and is only saved once the
+generator has been exhausted, so an interrupted run is simply repeated.
+"""
+import os
+from datetime import datetime, timedelta
+
+from bronto.utils import write_atomic
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def _to_utc(value):
+    offset = value.utcoffset()
+    value = value.replace(tzinfo=None, microsecond=0)
+    if offset is not None:
+        value -= offset
+    return value
+
+
+class ContactSync(object):
+    """
+    ``state_path`` is the file holding the high water mark. ``overlap`` is
+    subtracted from the mark when querying, to make up for clock skew and
+    second-granularity dates; contacts in that window may be yielded twice.
+    Other keyword arguments (``status``, ``list_ids``, ``fields``, ...) are
+    passed on to ``Client.iter_contacts``.
+    """
+
+    def __init__(self, client, state_path, overlap=timedelta(minutes=1),
+                 **filters):
+        self.client = client
+        self.state_path = state_path
+        self.overlap = overlap
+        self.filters = filters
+
+    @property
+    def high_water_mark(self):
+        """
+        The UTC ``modified`` date of the newest contact synced so far, or
+        None before the first complete run.
+        """
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as handle:
+            value = handle.read().strip()
+        return datetime.strptime(value, DATE_FORMAT) if value else None
+
+    @high_water_mark.setter
+    def high_water_mark(self, value):
+        write_atomic(self.state_path, _to_utc(value).strftime(DATE_FORMAT))
+
+    def changes(self):
+        """
+        Yield the contacts modified since the last complete run, then move the
+        high water mark forward.
+        """
+        mark = self.high_water_mark
+        since = mark - self.overlap if mark is not None else None
+        newest = mark
+        for contact in self.client.iter_contacts(modified_since=since,
+                                                 **self.filters):
+            modified = getattr(contact, 'modified', None)
+            if modified is not None:
+                modified = _to_utc(modified)
+                if newest is None or modified > newest:
+                    newest = modified
+            yield contact
+        if newest is not None and newest != mark:
+            self.high_water_mark = newest
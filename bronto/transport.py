@@ -0,0 +1,152 @@
+"""
+Record and replay the SOAP traffic of a Client.
+
+>>> from bronto.transport import RecordingTransport, ReplayTransport
+>>> client = Client(token, transport=RecordingTransport('job.cassette'))
+>>> client.login()
+>>> run_job(client)
+>>> client._client.options.transport.close()
+
+Later, offline and with the same timings every run:
+
+>>> client = Client('anything', transport=ReplayTransport('job.cassette'))
+>>> client.login()
+>>> run_job(client)
+
+A cassette is a gzipped file with one JSON document per request, holding
+the request and response bodies and how long the response took. API tokens
+and session ids are replaced by a placeholder before anything is written.
+"""
+import gzip
+import io
+import json
+import re
+import threading
+import time
+from collections import deque
+
+from suds.transport import Reply, Transport, TransportError
+from suds.transport.https import HttpAuthenticated
+
+SCRUBBED = 'SCRUBBED'
+
+_secret_patterns = [
+    re.compile(r'(<(?:\w+:)?apiToken>)[^<]*(</)'),
+    re.compile(r'(<(?:\w+:)?sessionId>)[^<]*(</)'),
+    re.compile(r'(<(?:\w+:)?loginResponse\b[^>]*>\s*<(?:\w+:)?return>)[^<]*'
+               r'(</)'),
+]
+
+
+def scrub(message):
+    """
+    Replace API tokens and session ids in a SOAP message.
+    """
+    if isinstance(message, bytes):
+        message = message.decode('utf-8')
+    for pattern in _secret_patterns:
+        message = pattern.sub(r'\g<1>%s\g<2>' % SCRUBBED, message)
+    return message
+
+
+class _SharedTransport(Transport):
+
+    def __deepcopy__(self, memo):
+        # suds copies the options, transport included, when a client is
+        # cloned; the clones must keep writing to (or reading from) the same
+        # cassette.
+        return self
+
+
+class RecordingTransport(_SharedTransport):
+    """
+    Send requests through ``transport`` (a regular suds HTTP transport by
+    default) and append every exchange to the cassette at ``path``.
+    """
+
+    def __init__(self, path, transport=None):
+        Transport.__init__(self)
+        self.transport = transport or HttpAuthenticated()
+        self.options = self.transport.options
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'wb')
+
+    def _record(self, kind, request, code, message, elapsed):
+        entry = {'kind': kind, 'url': request.url,
+                 'request': scrub(request.message or b''),
+                 'code': code, 'response': scrub(message or b''),
+                 'elapsed': round(elapsed, 6)}
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        with self._lock:
+            self._file.write(line.encode('utf-8'))
+
+    def _call(self, kind, request):
+        start = time.time()
+        try:
+            if kind == 'open':
+                reply = Reply(200, {}, self.transport.open(request).read())
+            else:
+                reply = self.transport.send(request)
+        except TransportError as e:
+            body = e.fp.read() if e.fp else b''
+            self._record(kind, request, e.httpcode, body, time.time() - start)
+            raise TransportError(e.args[0] if e.args else '', e.httpcode,
+                                 io.BytesIO(body))
+        self._record(kind, request, reply.code or 200, reply.message,
+                     time.time() - start)
+        return reply
+
+    def open(self, request):
+        return io.BytesIO(self._call('open', request).message)
+
+    def send(self, request):
+        return self._call('send', request)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ReplayTransport(_SharedTransport):
+    """
+    Answer requests from a cassette, matching them on their URL and
+    scrubbed body. Identical requests get the recorded responses in order,
+    the last one being repeated once they run out. With ``latency`` set to
+    ``'original'`` every response is delayed by as long as it originally
+    took; by default responses are immediate.
+    """
+
+    def __init__(self, path, latency=None):
+        Transport.__init__(self)
+        if latency not in (None, 'original'):
+            raise ValueError("latency must be None or 'original'")
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entries = {}
+        with gzip.open(path, 'rb') as cassette:
+            for line in cassette:
+                entry = json.loads(line.decode('utf-8'))
+                key = (entry['kind'], entry['url'], entry['request'])
+                self._entries.setdefault(key, deque()).append(entry)
+
+    def _replay(self, kind, request):
+        key = (kind, request.url, scrub(request.message or b''))
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise TransportError('No recorded response for %s %s'
+                                     % (kind, request.url), 404)
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+        if self.latency == 'original':
+            time.sleep(entry['elapsed'])
+        message = entry['response'].encode('utf-8')
+        if entry['code'] not in (200, None):
+            raise TransportError('Recorded HTTP %s' % entry['code'],
+                                 entry['code'], io.BytesIO(message))
+        return message
+
+    def open(self, request):
+        return io.BytesIO(self._replay('open', request))
+
+    def send(self, request):
+        return Reply(200, {}, self._replay('send', request))
@@ -0,0 +1,187 @@
+import os
+import threading
+
+
+def write_atomic(path, data):
+    """
+    Replace the contents of ``path`` with ``data`` so that readers never see
+    a partially written file.
+    """
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'w') as handle:
+        handle.write(data)
+    if hasattr(os, 'replace'):
+        os.replace(tmp_path, path)
+    else:
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+
+def format_date(value):
+    """
+    Format a datetime as an xs:dateTime string. Naive datetimes are assumed
+    to be in UTC.
+    """
+    if not hasattr(value, 'strftime'):
+        return value
+    offset = value.utcoffset()
+    if offset is not None:
+        value = value.replace(tzinfo=None) - offset
+    return value.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+def merge_contacts(contacts):
+    """
+    Normalize contact dicts and merge the ones describing the same contact.
+
+    Emails are trimmed and lowercased. Records sharing an id, an email or a
+    mobile number are merged, transitively, in order: later values win,
+    field by field for ``fields``, while ``listIds`` and ``SMSKeywordIDs``
+    are unioned. The merged contacts keep the position of their first
+    record. Raise ValueError when records to merge have different ids.
+    """
+    records = []
+    for contact in contacts:
+        contact = dict(contact)
+        if contact.get('email'):
+            contact['email'] = contact['email'].strip().lower()
+        if contact.get('mobileNumber'):
+            contact['mobileNumber'] = contact['mobileNumber'].strip()
+        records.append(contact)
+
+    # Union-find over the records, joined by the keys they share.
+    parents = list(range(len(records)))
+
+    def find(position):
+        while parents[position] != position:
+            parents[position] = parents[parents[position]]
+            position = parents[position]
+        return position
+
+    owners = {}
+    for position, contact in enumerate(records):
+        for key in [(x, contact[x]) for x in ('id', 'email', 'mobileNumber')
+                    if contact.get(x)]:
+            owner = owners.setdefault(key, position)
+            first, second = sorted([find(owner), find(position)])
+            parents[second] = first
+
+    merged = []
+    groups = {}
+    for position, contact in enumerate(records):
+        root = find(position)
+        if root not in groups:
+            groups[root] = len(merged)
+            merged.append({})
+        target = merged[groups[root]]
+        if contact.get('id') and target.get('id') and \
+                contact['id'] != target['id']:
+            raise ValueError('Contacts %s and %s have the same email or '
+                             'mobile number.' % (target['id'], contact['id']))
+        for attribute, value in contact.items():
+            if attribute == 'fields':
+                fields = dict(target.get('fields') or {})
+                fields.update(value)
+                target['fields'] = fields
+            elif attribute in ('listIds', 'SMSKeywordIDs'):
+                values = list(target.get(attribute) or [])
+                values.extend(x for x in value if x not in values)
+                target[attribute] = values
+            else:
+                target[attribute] = value
+    return merged
+
+
+class _Call(object):
+
+    def __init__(self, value=None):
+        self.value = value
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def get(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight(object):
+    """
+    Let concurrent callers asking for the same key share a single call
+    instead of each making their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if leader:
+            try:
+                call.result = func(*args, **kwargs)
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        return call.get()
+
+
+class Coalescer(object):
+    """
+    Merge concurrent single-key lookups into batched lookups.
+
+    Callers asking for a key that is already queued or being looked up share
+    its result. Within a group, one batch runs at a time: whoever finds no
+    batch running starts one with every key queued so far, so a lone caller
+    is never delayed and callers arriving meanwhile are batched together.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._groups = {}
+
+    def get(self, group, key, value, func):
+        """
+        Return the result for ``key``. ``func`` receives the ``value`` of
+        every queued key and returns a dict mapping values to results.
+        """
+        with self._cond:
+            state = self._groups.setdefault(
+                group, {'queued': {}, 'running': {}, 'busy': False})
+            call = state['running'].get(key) or state['queued'].get(key)
+            if call is None:
+                call = state['queued'][key] = _Call(value)
+            batch = None
+            while not call.done.is_set():
+                if not state['busy']:
+                    batch = state['running'] = state['queued']
+                    state['queued'] = {}
+                    state['busy'] = True
+                    break
+                self._cond.wait()
+        if batch is not None:
+            try:
+                results = func([x.value for x in batch.values()])
+                for batch_call in batch.values():
+                    batch_call.result = results.get(batch_call.value)
+            except Exception as e:
+                for batch_call in batch.values():
+                    batch_call.error = e
+            finally:
+                with self._cond:
+                    state['running'] = {}
+                    state['busy'] = False
+                    for batch_call in batch.values():
+                        batch_call.done.set()
+                    self._cond.notify_all()
+        return call.get()
@@ -0,0 +1,178 @@
+"""
+Checks run on records before they are sent, derived from the WSDL schema.
+
+The attributes a record may have, and the format of their values, come from
+the schema type it is sent as (``contactObject``, ``orderObject``, ...).
+Validators are built once per type and kept with the parsed WSDL, so every
+clone of a Client, and every process forked after ``load_wsdl``, shares
+them. A record Bronto would refuse for its shape (an unknown attribute, a
+date that isn't an xs:dateTime, a price that isn't a number, a malformed
+email) is rejected before the batch it is in is sent.
+"""
+import re
+import threading
+import weakref
+
+import six
+
+# String elements holding an email address.
+EMAIL_ATTRIBUTES = frozenset(['email', 'fromEmail', 'replyEmail'])
+
+_email = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+_date_time = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?'
+                        r'(Z|[+-]\d{2}:\d{2})?$')
+_integer = re.compile(r'^[+-]?\d+$')
+
+
+def _is_email(value):
+    return isinstance(value, six.string_types) and bool(
+        _email.match(value.strip()))
+
+
+def _is_date_time(value):
+    if hasattr(value, 'strftime'):
+        return True
+    return isinstance(value, six.string_types) and bool(
+        _date_time.match(value))
+
+
+def _is_number(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, six.integer_types + (float, )):
+        return True
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _is_integer(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, six.integer_types):
+        return True
+    return isinstance(value, six.string_types) and bool(
+        _integer.match(value))
+
+
+def _is_boolean(value):
+    return isinstance(value, bool) or value in ('true', 'false', '1', '0',
+                                                1, 0)
+
+
+_builtin_checks = {
+    'dateTime': _is_date_time,
+    'double': _is_number,
+    'float': _is_number,
+    'decimal': _is_number,
+    'int': _is_integer,
+    'integer': _is_integer,
+    'long': _is_integer,
+    'short': _is_integer,
+    'boolean': _is_boolean,
+}
+
+
+def _each(check):
+    def check_each(value):
+        if isinstance(value, (list, tuple)):
+            return all(check(x) for x in value)
+        return check(value)
+    return check_each
+
+
+class RecordValidator(object):
+    """
+    ``name`` is used in error messages, ``attributes`` are the allowed
+    attributes and ``required`` those every record must have. ``checks``
+    maps attributes to a function telling whether a value is valid, and
+    ``children`` maps attributes holding lists of nested records to the
+    RecordValidator for those.
+    """
+
+    def __init__(self, name, attributes, required=(), checks=None,
+                 children=None):
+        self.name = name
+        self.attributes = frozenset(attributes)
+        self.required = list(required)
+        self._required = frozenset(required)
+        self.checks = checks or {}
+        self.children = children or {}
+        self._checked = frozenset(self.checks)
+        self._nested = frozenset(self.children)
+
+    def validate(self, records):
+        """
+        Raise KeyError for an unknown attribute, or ValueError for a missing
+        attribute or an invalid value, in any of ``records``.
+        """
+        for record in records:
+            if not isinstance(record, dict):
+                raise ValueError('Invalid %s: %r' % (self.name, record))
+            keys = frozenset(record)
+            unknown = keys - self.attributes
+            if unknown:
+                raise KeyError('Invalid %s attribute: %s'
+                               % (self.name, sorted(unknown)[0]))
+            if not self._required <= keys:
+                raise ValueError('The attributes %s are required.'
+                                 % self.required)
+            for attribute in keys & self._checked:
+                value = record[attribute]
+                if value is not None and not self.checks[attribute](value):
+                    raise ValueError('Invalid %s %s: %r'
+                                     % (self.name, attribute, value))
+            for attribute in keys & self._nested:
+                value = record[attribute]
+                if isinstance(value, (list, tuple)):
+                    self.children[attribute].validate(
+                        [x for x in value if isinstance(x, dict)])
+
+
+def _build(schema_type, name, required=(), parents=()):
+    attributes = []
+    checks = {}
+    children = {}
+    for element, ancestry in schema_type.children():
+        attributes.append(element.name)
+        resolved = element.resolve()
+        if resolved.enum():
+            check = frozenset(x.name for x, y in resolved.children()) \
+                .__contains__
+        elif resolved.builtin():
+            check = _builtin_checks.get(resolved.name)
+            if check is None and element.name in EMAIL_ATTRIBUTES:
+                check = _is_email
+        else:
+            # Types containing themselves are only checked one level deep.
+            if resolved.name not in parents:
+                children[element.name] = _build(
+                    resolved, re.sub('Object$', '', resolved.name), (),
+                    parents + (schema_type.name, ))
+            continue
+        if check is not None:
+            checks[element.name] = (_each(check) if element.multi_occurrence()
+                                    else check)
+    return RecordValidator(name, attributes, required, checks, children)
+
+
+_validators = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_validator(suds_client, type_name, name, required=()):
+    """
+    Return the RecordValidator for the schema type ``type_name`` of a parsed
+    suds client, building it on first use.
+    """
+    key = (type_name, name, tuple(required))
+    with _lock:
+        validators = _validators.setdefault(suds_client.wsdl, {})
+        if key not in validators:
+            schema_type = suds_client.factory.resolver.find(type_name)
+            if schema_type is None:
+                raise ValueError('Unknown schema type: %s' % type_name)
+            validators[key] = _build(schema_type, name, required)
+        return validators[key]
@@ -8,7 +8,7 @@ os.chdir(os.path.normpath(os.path.join(os.path.abspath(__file__), os.pardir)))
 
 VERSION = bronto.__version__
 github_url = 'http://github.com/Scotts-Marketplace/bronto-python/'
-requires = ['suds-jurko', 'six']
+requires = ['suds-jurko', 'six', 'futures; python_version < "3.0"']
 
 setup(name='bronto-python',
       version=VERSION,
@@ -20,6 +20,9 @@ setup(name='bronto-python',
       packages=find_packages(),
       include_package_data=True,
       install_requires=requires,
+      entry_points={
+          'console_scripts': ['bronto = bronto.cli:main'],
+      },
       tests_require=requires + ['mock'],
       description='A python wrapper around Bronto\'s SOAP API',
       long_description=open('README.rst').read(),
@@ -1,11 +1,27 @@
 #!/usr/bin/env python
 
+import gzip
+import io
+import json
 import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
 import uuid
 
-from bronto import client
-from datetime import datetime
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from bronto import (activities, cache, cli, client, deliveries, dispatch,
+                    importer, orders, outbox, query, sync, utils, validation)
+from datetime import datetime, timedelta
 
 
 class BrontoTest(unittest.TestCase):
@@ -347,5 +363,1100 @@ class BrontoDeliveryTest(BrontoTest):
         response = self._client.delete_contact(self.addl_contact_info['email'])
         self.assertIs(response.isError, False)
 
+class ImportTimeTest(unittest.TestCase):
+
+    def test_client_import_does_not_load_suds(self):
+        script = ('import sys; '
+                  'from bronto.client import Client, BrontoError; '
+                  'Client("token"); '
+                  'print("suds" in sys.modules)')
+        output = subprocess.check_output(
+            [sys.executable, '-c', script],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.decode('ascii').strip(), 'False')
+
+
+class ContactLookupTest(unittest.TestCase):
+
+    def test_get_contacts_by_email_chunks(self):
+        bronto = client.Client('token')
+        bronto._client = mock.Mock()
+        bronto._client.factory.create.side_effect = lambda name: mock.Mock()
+        bronto._email_chunk_size = 2
+        bronto.get_fields = mock.Mock(return_value=[])
+
+        sent = []
+
+        def read_contacts(contact_filter, *args):
+            sent.extend(x.value for x in contact_filter.email)
+            return [mock.Mock(email=x.value.upper())
+                    for x in contact_filter.email]
+        bronto._read_contacts = mock.Mock(side_effect=read_contacts)
+        found = bronto.get_contacts_by_email(['a@x.com', 'b@x.com',
+                                              'A@x.com ', ' c@x.com '])
+        self.assertEqual(sorted(found), [' c@x.com ', 'a@x.com', 'b@x.com'])
+        self.assertEqual(sent, ['a@x.com', 'b@x.com', 'c@x.com'])
+        # One call per chunk, without reading a second, empty, page.
+        self.assertEqual(bronto._read_contacts.call_count, 2)
+
+        found = bronto.get_contacts(['a@x.com', 'b@x.com', 'c@x.com'])
+        self.assertEqual([x.email for x in found],
+                         ['A@X.COM', 'B@X.COM', 'C@X.COM'])
+        self.assertEqual(bronto.get_contacts(['a@x.com'], page_number=2), [])
+
+    def test_workers_submit_inline(self):
+        bronto = client.Client('token', max_workers=4)
+        bronto._client = mock.Mock()
+        bronto.session_id = 'session'
+        worker = bronto._submit(lambda c: c).result()
+        self.assertIsNot(worker, bronto)
+        self.assertIsNone(worker._max_workers)
+        self.assertIs(worker._submit(lambda c: c).result(), worker)
+
+
+class ForkTest(unittest.TestCase):
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Needs os.fork')
+    def test_forked_worker_reuses_wsdl_with_own_session(self):
+        bronto = client.Client('token', max_workers=2)
+        suds_client = bronto._client = mock.Mock()
+        suds_client.service.login.return_value = 'parent'
+        bronto.login()
+        self.assertEqual(bronto._submit(lambda c: c.session_id).result(),
+                         'parent')
+        pid = os.fork()
+        if pid == 0:
+            ok = False
+            try:
+                suds_client.service.login.return_value = 'child'
+                bronto.login()
+                ok = (bronto._client is suds_client and
+                      bronto._submit(lambda c: c.session_id).result() ==
+                      'child')
+            finally:
+                os._exit(0 if ok else 1)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertEqual(bronto.session_id, 'parent')
+        bronto._executor.shutdown()
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Needs os.fork')
+    def test_forked_process_opens_its_own_cache_connection(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        backend = cache.SQLiteBackend(os.path.join(directory, 'cache.db'))
+        backend.set('key', 'parent')
+        parent_db = backend._connect()
+        pid = os.fork()
+        if pid == 0:
+            ok = False
+            try:
+                ok = backend.get('key') == 'parent'
+                backend.set('key', 'child')
+                ok = ok and backend._connect() is not parent_db
+            finally:
+                os._exit(0 if ok else 1)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertIs(backend._connect(), parent_db)
+        self.assertEqual(backend.get('key'), 'child')
+
+
+class MetadataCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = client.Client('token')
+        self.client._client = mock.Mock()
+        self.client._cached_fields = {}
+        self.client._cached_fields_by_id = {}
+        self.pages = [[mock.Mock(id='1'), mock.Mock(id='2')],
+                      [mock.Mock(id='3')], []]
+        for field in sum(self.pages, []):
+            field.name = 'field%s' % field.id
+        self.client._client.service.readFields.side_effect = \
+            lambda *args, **kwargs: self.pages[kwargs['pageNumber'] - 1]
+
+    def test_get_fields_reads_every_page(self):
+        fields = self.client.get_fields()
+        self.assertEqual([x.id for x in fields], ['1', '2', '3'])
+        self.assertIs(self.client._cached_all_fields, True)
+        self.assertEqual(self.client.get_field_by_id('3').name, 'field3')
+        self.assertEqual(self.client._client.service.readFields.call_count, 3)
+
+    def test_get_field_by_id_reads_missing(self):
+        self.assertEqual(self.client.get_field_by_id('2').name, 'field2')
+        self.assertEqual(self.client.get_field('field1').id, '1')
+
+    def test_metadata_cache_is_shared(self):
+        from suds.sudsobject import Factory
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'metadata.db')
+        self.pages = [[Factory.object('fieldObject',
+                                      {'id': '1', 'name': 'field1'})], []]
+        self.client._metadata_cache = cache.MetadataCache(path)
+        self.client.get_fields()
+
+        other = client.Client('token',
+                              metadata_cache=cache.MetadataCache(path))
+        other._client = mock.Mock()
+        other._cached_fields = {}
+        other._cached_fields_by_id = {}
+        other._load_metadata()
+        self.assertIs(other._cached_all_fields, True)
+        self.assertEqual(other.get_field('field1').id, '1')
+        self.assertEqual(other.get_field_by_id('1').name, 'field1')
+        self.assertFalse(other._client.service.readFields.called)
+
+        # Only the first process finding the entry stale refreshes it.
+        stale = cache.MetadataCache(path, ttl=60)
+        with stale._connect() as db:
+            db.execute('UPDATE metadata SET updated = updated - 120')
+        account = other._metadata_account()
+        self.assertIs(stale.get(account, 'fields')[1], False)
+        self.assertIs(stale.claim_refresh(account, 'fields'), True)
+        self.assertIs(cache.MetadataCache(path, ttl=60).claim_refresh(
+            account, 'fields'), False)
+
+
+class MergeContactsTest(unittest.TestCase):
+
+    def test_merge_contacts(self):
+        merged = utils.merge_contacts([
+            {'email': ' Me@Domain.com', 'listIds': ['1'],
+             'fields': {'firstname': 'Old', 'lastname': 'Name'}},
+            {'email': 'you@domain.com'},
+            {'email': 'me@domain.com', 'mobileNumber': '6025555555',
+             'listIds': ['2', '1'], 'fields': {'firstname': 'New'}},
+            {'mobileNumber': '6025555555', 'status': 'active'},
+        ])
+        self.assertEqual(merged, [
+            {'email': 'me@domain.com', 'mobileNumber': '6025555555',
+             'status': 'active', 'listIds': ['1', '2'],
+             'fields': {'firstname': 'New', 'lastname': 'Name'}},
+            {'email': 'you@domain.com'}])
+
+    def test_merge_contacts_transitively(self):
+        merged = utils.merge_contacts([
+            {'email': 'me@domain.com', 'listIds': ['1']},
+            {'mobileNumber': '6025555555', 'listIds': ['2']},
+            {'email': 'me@domain.com', 'mobileNumber': '6025555555'},
+        ])
+        self.assertEqual(merged, [{'email': 'me@domain.com',
+                                   'mobileNumber': '6025555555',
+                                   'listIds': ['1', '2']}])
+
+    def test_merge_contacts_with_different_ids(self):
+        with self.assertRaises(ValueError):
+            utils.merge_contacts([{'id': '1', 'email': 'me@domain.com'},
+                                  {'id': '2', 'email': 'Me@domain.com'}])
+
+
+class CoalescingTest(unittest.TestCase):
+
+    def _start(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.start()
+        return thread
+
+    def test_single_flight_shares_call(self):
+        single_flight = utils.SingleFlight()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def read():
+            calls.append(1)
+            release.wait()
+            return 'fields'
+
+        threads = [self._start(lambda: results.append(
+            single_flight.do('fields', read))) for x in range(5)]
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['fields'] * 5)
+
+    def test_coalescer_batches_waiting_keys(self):
+        coalescer = utils.Coalescer()
+        release = threading.Event()
+        batches = []
+        results = {}
+
+        def lookup(emails):
+            batches.append(sorted(emails))
+            release.wait()
+            return dict((x, x.upper()) for x in emails)
+
+        def get(email):
+            results[email] = coalescer.get('contacts', email, email, lookup)
+
+        threads = [self._start(get, 'a')]
+        time.sleep(0.1)
+        threads += [self._start(get, x) for x in ('b', 'c', 'b')]
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(batches, [['a'], ['b', 'c']])
+        self.assertEqual(results, {'a': 'A', 'b': 'B', 'c': 'C'})
+
+
+class ContactCacheTest(unittest.TestCase):
+    options = (False, (), False)
+
+    def _contact(self, email='Me@Domain.com', id='1'):
+        from suds.sudsobject import Factory
+        return Factory.object('contactObject', {'email': email, 'id': id})
+
+    def test_memory_backend_lru_and_ttl(self):
+        backend = cache.MemoryBackend(max_size=2, ttl=60)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+        self.assertEqual((backend.get('a'), backend.get('b')), (1, None))
+        backend.ttl = -1
+        backend.set('d', 4)
+        self.assertIsNone(backend.get('d'))
+
+    def test_sqlite_backend_round_trip(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            contact_cache = cache.ContactCache(cache.SQLiteBackend(path))
+            contact_cache.set(self._contact(), self.options)
+            contact = contact_cache.get('me@domain.com', self.options)
+            self.assertEqual((contact.email, contact.id),
+                             ('Me@Domain.com', '1'))
+            self.assertIsNone(contact_cache.get('me@domain.com',
+                                                (True, (), False)))
+            contact_cache.invalidate(ids=['1'])
+            self.assertIsNone(contact_cache.get('me@domain.com', self.options))
+        finally:
+            os.remove(path)
+
+    def test_client_reads_through_and_invalidates(self):
+        bronto = client.Client('token', contact_cache=cache.ContactCache())
+        bronto._client = mock.Mock()
+        bronto.get_fields = mock.Mock(return_value=[])
+        bronto._read_contacts = mock.Mock(return_value=[self._contact()])
+        self.assertEqual(bronto.get_contact('me@domain.com').id, '1')
+        self.assertEqual(bronto.get_contact('ME@domain.com').id, '1')
+        self.assertEqual(bronto._read_contacts.call_count, 1)
+        bronto._client.service.addOrUpdateContacts.return_value = mock.Mock(
+            spec=['results'])
+        bronto._construct_contact = lambda contact: mock.Mock(
+            email=contact['email'], id=None)
+        bronto._validator = lambda *args: validation.RecordValidator(
+            'contact', ['email'])
+        bronto.add_or_update_contacts([{'email': 'me@domain.com'}])
+        bronto.get_contact('me@domain.com')
+        self.assertEqual(bronto._read_contacts.call_count, 2)
+
+
+class TransportTest(unittest.TestCase):
+
+    def setUp(self):
+        from bronto import transport
+        from suds.transport import Reply, Request, Transport
+        self.transport = transport
+        self.request = lambda body: Request('https://api.bronto.com/v4', body)
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+        class FakeTransport(Transport):
+            def send(self, request):
+                if b'apiToken' in request.message:
+                    return Reply(200, {}, b'<ns2:loginResponse><return>'
+                                          b'secret-session</return>')
+                return Reply(200, {}, b'<return>' + request.message + b'</return>')
+        self.inner = FakeTransport()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_record_and_replay(self):
+        recorder = self.transport.RecordingTransport(self.path, self.inner)
+        recorder.send(self.request(b'<apiToken>secret-token</apiToken>'))
+        recorder.send(self.request(b'<sessionId>secret-session</sessionId>'
+                                   b'<readLists/>'))
+        recorder.close()
+        with gzip.open(self.path, 'rb') as cassette:
+            data = cassette.read()
+        self.assertNotIn(b'secret', data)
+
+        replayer = self.transport.ReplayTransport(self.path)
+        login = replayer.send(self.request(b'<apiToken>other</apiToken>'))
+        self.assertIn(b'SCRUBBED', login.message)
+        reply = replayer.send(self.request(b'<sessionId>SCRUBBED</sessionId>'
+                                           b'<readLists/>'))
+        self.assertIn(b'<readLists/>', reply.message)
+        with self.assertRaises(self.transport.TransportError):
+            replayer.send(self.request(b'<readFields/>'))
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def test_limit_grows_additively_and_halves_on_overload(self):
+        dispatcher = dispatch.Dispatcher(initial_limit=2, max_limit=3)
+        for i in range(10):
+            started = [dispatcher.acquire() for x in range(int(
+                dispatcher.limit))]
+            for x in started:
+                dispatcher.release(x)
+        self.assertEqual(dispatcher.limit, 3)
+        started = [dispatcher.acquire() for x in range(3)]
+        for x in started:
+            dispatcher.release(x, overloaded=True)
+        # Only the first of the failures sent at the old limit counts.
+        self.assertEqual(dispatcher.limit, 1.5)
+
+    def test_circuit_opens_and_recovers(self):
+        dispatcher = dispatch.Dispatcher(failure_threshold=2,
+                                         reset_timeout=60)
+        for i in range(2):
+            dispatcher.release(dispatcher.acquire(), overloaded=True)
+        self.assertEqual(dispatcher.state, 'open')
+        with self.assertRaises(dispatch.CircuitOpenError):
+            dispatcher.acquire()
+        dispatcher._opened -= 60
+        self.assertEqual(dispatcher.state, 'half-open')
+        started = dispatcher.acquire()
+        # Only one trial request at a time.
+        self.assertRaises(client.BrontoError, dispatcher.acquire)
+        dispatcher.release(started)
+        self.assertEqual(dispatcher.state, 'closed')
+
+    def test_transport_reports_overload(self):
+        from suds.transport import TransportError
+        inner = mock.Mock()
+        inner.send.side_effect = TransportError('Unavailable', 503,
+                                                io.BytesIO(b'busy'))
+        dispatcher = dispatch.Dispatcher(failure_threshold=1)
+        transport = dispatch.DispatchTransport(dispatcher, inner)
+        with self.assertRaises(TransportError) as raised:
+            transport.send(mock.Mock())
+        self.assertEqual(raised.exception.fp.read(), b'busy')
+        self.assertEqual(dispatcher.state, 'open')
+        self.assertEqual(dispatcher.in_flight, 0)
+
+
+class ValidationTest(unittest.TestCase):
+    wsdl = b"""<?xml version="1.0" encoding="UTF-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:xs="http://www.w3.org/2001/XMLSchema"
+    xmlns:tns="http://api.bronto.com/v4"
+    targetNamespace="http://api.bronto.com/v4">
+  <types>
+    <xs:schema targetNamespace="http://api.bronto.com/v4">
+      <xs:complexType name="orderObject"><xs:sequence>
+        <xs:element name="id" type="xs:string" minOccurs="0"/>
+        <xs:element name="email" type="xs:string" minOccurs="0"/>
+        <xs:element name="products" type="tns:productObject" minOccurs="0"
+                    maxOccurs="unbounded"/>
+        <xs:element name="orderDate" type="xs:dateTime" minOccurs="0"/>
+        <xs:element name="status" type="tns:orderStatus" minOccurs="0"/>
+      </xs:sequence></xs:complexType>
+      <xs:complexType name="productObject"><xs:sequence>
+        <xs:element name="sku" type="xs:string" minOccurs="0"/>
+        <xs:element name="price" type="xs:double" minOccurs="0"/>
+        <xs:element name="quantity" type="xs:int" minOccurs="0"/>
+      </xs:sequence></xs:complexType>
+      <xs:simpleType name="orderStatus">
+        <xs:restriction base="xs:string">
+          <xs:enumeration value="PENDING"/>
+          <xs:enumeration value="PROCESSED"/>
+        </xs:restriction>
+      </xs:simpleType>
+      <xs:element name="addOrUpdateOrders"><xs:complexType><xs:sequence>
+        <xs:element name="orders" type="tns:orderObject"
+                    maxOccurs="unbounded"/>
+      </xs:sequence></xs:complexType></xs:element>
+    </xs:schema>
+  </types>
+  <message name="addOrUpdateOrders">
+    <part name="parameters" element="tns:addOrUpdateOrders"/>
+  </message>
+  <portType name="BrontoSoapPortType">
+    <operation name="addOrUpdateOrders">
+      <input message="tns:addOrUpdateOrders"/>
+    </operation>
+  </portType>
+  <binding name="BrontoSoapBinding" type="tns:BrontoSoapPortType">
+    <soap:binding style="document"
+                  transport="http://schemas.xmlsoap.org/soap/http"/>
+    <operation name="addOrUpdateOrders">
+      <soap:operation soapAction=""/>
+      <input><soap:body use="literal"/></input>
+    </operation>
+  </binding>
+  <service name="BrontoSoapApiImplService">
+    <port name="BrontoSoapPort" binding="tns:BrontoSoapBinding">
+      <soap:address location="http://localhost:1/v4"/>
+    </port>
+  </service>
+</definitions>
+"""
+
+    def setUp(self):
+        import suds.client
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'bronto.wsdl')
+        with open(path, 'wb') as handle:
+            handle.write(self.wsdl)
+        self.bronto = client.Client('token')
+        self.bronto._client = suds.client.Client('file://%s' % path,
+                                                 cache=None)
+
+    def test_validators_are_built_once_from_the_schema(self):
+        validator = self.bronto._validator('orderObject', 'order')
+        other = client.Client('token')
+        other._client = self.bronto._client
+        self.assertIs(other._validator('orderObject', 'order'), validator)
+        self.assertEqual(validator.attributes, frozenset(
+            ['id', 'email', 'products', 'orderDate', 'status']))
+        validator.validate([{
+            'id': '1', 'email': 'me@domain.com', 'status': 'PENDING',
+            'orderDate': datetime(2015, 1, 2),
+            'products': [{'sku': 'a', 'price': '9.99', 'quantity': 2}]}, {
+            'id': '2', 'orderDate': '2015-01-02T03:04:05+00:00'}])
+
+    def test_add_orders_rejects_invalid_orders_locally(self):
+        with mock.patch.object(self.bronto._client.service,
+                               'addOrUpdateOrders') as send:
+            for order, error in [
+                    ({'id': '1', 'colour': 'red'}, KeyError),
+                    ({'id': '1', 'email': 'me@domain'}, ValueError),
+                    ({'id': '1', 'orderDate': '02/01/2015'}, ValueError),
+                    ({'id': '1', 'status': 'LOST'}, ValueError),
+                    ({'id': '1', 'products': [{'price': 'free'}]}, ValueError),
+                    ({'id': '1', 'products': [{'colour': 'red'}]}, KeyError)]:
+                with self.assertRaises(error):
+                    self.bronto.add_orders([{'id': '0'}, order])
+            self.assertFalse(send.called)
+
+
+class OrderPipelineTest(unittest.TestCase):
+
+    def test_process_merges_duplicates(self):
+        bronto = mock.Mock(_max_workers=None)
+        bronto._validator.return_value = validation.RecordValidator(
+            'order', ['id', 'products'], children={
+                'products': validation.RecordValidator('product', ['sku'])})
+        bronto._submit.side_effect = lambda func, *args: mock.Mock(
+            done=lambda: True, result=lambda: func(bronto, *args))
+        bronto.add_orders.side_effect = lambda batch: mock.Mock(
+            results=[mock.Mock(isError=x['id'] == 'c', errorCode=1,
+                               errorString='Bad') for x in batch])
+        events = [{'id': 'a', 'products': [{'sku': '1'}]},
+                  {'id': 'b'},
+                  {'id': 'a', 'products': [{'sku': '2'}]},
+                  {'id': 'x', 'products': [{'colour': 'red'}]},
+                  {'id': 'c'}]
+        results = list(orders.OrderPipeline(bronto, batch_size=3)
+                       .process(iter(events)))
+        self.assertEqual(sorted(results), [
+            orders.OrderResult('a', None, 2),
+            orders.OrderResult('b', None, 1),
+            orders.OrderResult('c', '1: Bad', 1),
+            orders.OrderResult('x', 'Invalid product attribute: colour', 1)])
+        self.assertEqual(bronto.add_orders.call_count, 1)
+        first_batch = bronto.add_orders.call_args[0][0]
+        self.assertEqual(sorted(x['id'] for x in first_batch), ['a', 'b', 'c'])
+        self.assertIn({'id': 'a', 'products': [{'sku': '2'}]}, first_batch)
+
+    def test_process_reports_transport_errors_per_order(self):
+        bronto = mock.Mock(_max_workers=None)
+        bronto._validator.return_value = validation.RecordValidator(
+            'order', ['id'])
+        bronto._submit.side_effect = lambda func, *args: mock.Mock(
+            done=lambda: False, result=lambda: func(bronto, *args))
+
+        def add_orders(batch):
+            if batch[0]['id'] == 'b':
+                raise socket.timeout('timed out')
+            return mock.Mock(results=[mock.Mock(isError=False)])
+        bronto.add_orders.side_effect = add_orders
+        pipeline = orders.OrderPipeline(bronto, batch_size=1, retries=1,
+                                        retry_delay=0)
+        results = list(pipeline.process([{'id': 'a'}, {'id': 'b'},
+                                         {'id': 'c'}]))
+        self.assertEqual(results, [orders.OrderResult('a', None, 1),
+                                   orders.OrderResult('b', 'timed out', 1),
+                                   orders.OrderResult('c', None, 1)])
+        self.assertEqual(bronto.add_orders.call_count, 4)
+
+    def test_process_keeps_writes_of_an_order_in_sequence(self):
+        bronto = mock.Mock(_max_workers=4)
+        bronto._validator.return_value = validation.RecordValidator(
+            'order', ['id', 'status'])
+        events = []
+
+        def submit(func, batch, updates):
+            events.append(('sent', batch['a']['status']))
+
+            def result():
+                events.append(('done', batch['a']['status']))
+                return func(bronto, batch, updates)
+            return mock.Mock(done=lambda: False, result=result)
+        bronto._submit.side_effect = submit
+        bronto.add_orders.side_effect = lambda batch: mock.Mock(
+            results=[mock.Mock(isError=False) for x in batch])
+        results = list(orders.OrderPipeline(bronto, batch_size=1).process(
+            [{'id': 'a', 'status': 'PENDING'},
+             {'id': 'a', 'status': 'PROCESSED'}]))
+        self.assertEqual(len(results), 2)
+        self.assertEqual(events, [('sent', 'PENDING'), ('done', 'PENDING'),
+                                  ('sent', 'PROCESSED'),
+                                  ('done', 'PROCESSED')])
+
+
+class ContactImporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.client = mock.Mock(_max_workers=None)
+        self.client._validator.return_value = validation.RecordValidator(
+            'contact', ['email', 'listIds', 'fields'],
+            checks={'email': validation._is_email})
+        self.client._submit.side_effect = lambda func, *args: mock.Mock(
+            done=lambda: True, result=lambda: func(self.client, *args))
+        self.client.get_fields.return_value = [mock.Mock()]
+        self.client.get_fields.return_value[0].name = 'firstname'
+        self.client.add_or_update_contacts.side_effect = lambda contacts: \
+            mock.Mock(results=[mock.Mock(isError=False, id=c['email'],
+                                         isNew=True) for c in contacts])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as handle:
+            handle.write(data)
+        return path
+
+    def test_import_csv_with_checkpoint(self):
+        path = self._write('contacts.csv', 'E-mail,firstname,listIds\n'
+                           'a@example.com,A,"1, 2"\n'
+                           ',,\n'
+                           'c@example.com,,\n')
+        checkpoint = os.path.join(self.tmpdir, 'checkpoint')
+        contact_importer = importer.ContactImporter(
+            self.client, mapping={'E-mail': 'email'}, batch_size=1,
+            results=os.path.join(self.tmpdir, 'results.csv'),
+            checkpoint=checkpoint)
+        stats = contact_importer.import_file(path)
+        self.assertEqual(stats, {'imported': 2, 'failed': 1, 'skipped': 0})
+        self.client.add_or_update_contacts.assert_any_call(
+            [{'email': 'a@example.com', 'listIds': ['1', '2'],
+              'fields': {'firstname': 'A'}}])
+        with open(checkpoint) as handle:
+            self.assertEqual(handle.read(), '3')
+        stats = contact_importer.import_file(path)
+        self.assertEqual(stats, {'imported': 0, 'failed': 0, 'skipped': 3})
+
+    def test_import_reports_invalid_rows(self):
+        path = self._write('contacts.ndjson',
+                           '{"email": "a@example.com"}\n'
+                           '{"email": "not-an-email"}\n')
+        results = os.path.join(self.tmpdir, 'results.csv')
+        contact_importer = importer.ContactImporter(self.client,
+                                                    results=results)
+        stats = contact_importer.import_file(path)
+        self.assertEqual(stats, {'imported': 1, 'failed': 1, 'skipped': 0})
+        self.client.add_or_update_contacts.assert_called_once_with(
+            [{'email': 'a@example.com'}])
+        with open(results) as handle:
+            self.assertIn("2,,,invalid,Invalid contact email: 'not-an-email'",
+                          handle.read())
+
+    def test_import_retries_transient_errors(self):
+        path = self._write('contacts.ndjson', '{"email": "a@example.com"}\n')
+        send = self.client.add_or_update_contacts.side_effect
+        errors = [socket.timeout('timed out'),
+                  Exception((503, 'Service Unavailable'))]
+
+        def flaky_send(contacts):
+            if errors:
+                raise errors.pop(0)
+            return send(contacts)
+        self.client.add_or_update_contacts.side_effect = flaky_send
+        contact_importer = importer.ContactImporter(self.client, retries=2,
+                                                    retry_delay=0)
+        stats = contact_importer.import_file(path)
+        self.assertEqual(stats, {'imported': 1, 'failed': 0, 'skipped': 0})
+        self.assertEqual(self.client.add_or_update_contacts.call_count, 3)
+
+    def test_import_fails_faults_without_retrying(self):
+        path = self._write('contacts.ndjson', '{"email": "a@example.com"}\n')
+        results = os.path.join(self.tmpdir, 'results.csv')
+        self.client.add_or_update_contacts.side_effect = \
+            client.BrontoError('Invalid session')
+        contact_importer = importer.ContactImporter(self.client,
+                                                    results=results)
+        with mock.patch.object(importer.time, 'sleep') as sleep:
+            stats = contact_importer.import_file(path)
+        self.assertEqual(stats, {'imported': 0, 'failed': 1, 'skipped': 0})
+        self.assertFalse(sleep.called)
+        self.assertEqual(self.client.add_or_update_contacts.call_count, 1)
+        with open(results) as handle:
+            self.assertIn('1,,,failed,Invalid session', handle.read())
+
+    def test_import_unknown_field(self):
+        path = self._write('contacts.ndjson',
+                           '{"email": "a@example.com", "nickname": "A"}\n'
+                           '{"email": "b@example.com", "firstname": "B"}\n')
+        results = os.path.join(self.tmpdir, 'results.csv')
+        checkpoint = os.path.join(self.tmpdir, 'checkpoint')
+        contact_importer = importer.ContactImporter(
+            self.client, results=results, checkpoint=checkpoint)
+        stats = contact_importer.import_file(path)
+        self.assertEqual(stats, {'imported': 1, 'failed': 1, 'skipped': 0})
+        self.client.add_or_update_contacts.assert_called_once_with(
+            [{'email': 'b@example.com', 'fields': {'firstname': 'B'}}])
+        with open(results) as handle:
+            self.assertIn('1,,,invalid,Invalid contactField: nickname',
+                          handle.read())
+        with open(checkpoint) as handle:
+            self.assertEqual(handle.read(), '2')
+
+
+class ContactSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.state_path = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(self.state_path)
+        self.client = mock.Mock()
+
+    def tearDown(self):
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def test_changes_moves_high_water_mark(self):
+        contacts = [mock.Mock(modified=datetime(2015, 1, 2, 3, 4, 5)),
+                    mock.Mock(modified=datetime(2015, 1, 1))]
+        self.client.iter_contacts.return_value = iter(contacts)
+        contact_sync = sync.ContactSync(self.client, self.state_path,
+                                        status='active')
+        self.assertEqual(list(contact_sync.changes()), contacts)
+        self.client.iter_contacts.assert_called_with(modified_since=None,
+                                                     status='active')
+        self.assertEqual(contact_sync.high_water_mark,
+                         datetime(2015, 1, 2, 3, 4, 5))
+
+        self.client.iter_contacts.return_value = iter([])
+        self.assertEqual(list(contact_sync.changes()), [])
+        self.client.iter_contacts.assert_called_with(
+            modified_since=datetime(2015, 1, 2, 3, 4, 5) - timedelta(minutes=1),
+            status='active')
+        self.assertEqual(contact_sync.high_water_mark,
+                         datetime(2015, 1, 2, 3, 4, 5))
+
+
+class ActivityExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.directory, 'state')
+        self.client = mock.Mock()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _activity(self, created, contact_id, activity_type='open'):
+        from suds.sudsobject import Factory
+        return Factory.object('recentActivityObject', {
+            'createdDate': created, 'contactId': contact_id,
+            'activityType': activity_type, 'linkUrl': None})
+
+    def test_outbound_resumes_from_cursor(self):
+        start = datetime.utcnow().replace(microsecond=0) - timedelta(hours=2)
+        later = start + timedelta(hours=1)
+        first = self._activity(start, 'a')
+        second = self._activity(later, 'b')
+        self.client.iter_recent_outbound_activities.return_value = iter(
+            [first, second])
+        path = os.path.join(self.directory, 'outbound.ndjson')
+        export = activities.ActivityExport(self.client, self.state_path)
+        self.assertEqual(export.outbound(path, types=['open']), 2)
+        with open(path) as handle:
+            self.assertEqual(
+                [json.loads(line) for line in handle],
+                [{'activityType': 'open', 'contactId': 'a',
+                  'createdDate': utils.format_date(start)},
+                 {'activityType': 'open', 'contactId': 'b',
+                  'createdDate': utils.format_date(later)}])
+
+        # The window starts again at the newest date, skipping what was
+        # already exported at that date.
+        third = self._activity(later, 'c')
+        self.client.iter_recent_outbound_activities.return_value = iter(
+            [second, third])
+        records = []
+        self.assertEqual(export.outbound(records.append, types=['open']), 1)
+        self.client.iter_recent_outbound_activities.assert_called_with(
+            later - timedelta(seconds=1), types=['open'])
+        self.assertEqual([x['contactId'] for x in records], ['c'])
+
+    def test_deliveries_at_the_cursor_are_read_again(self):
+        start = datetime.utcnow().replace(microsecond=0) - timedelta(hours=1)
+        from suds.sudsobject import Factory
+        first = Factory.object('deliveryObject', {'id': '1', 'start': start})
+        second = Factory.object('deliveryObject', {'id': '2', 'start': start})
+        undated = Factory.object('deliveryObject', {'id': '3'})
+        export = activities.ActivityExport(self.client, self.state_path)
+        export._save_cursor('deliveries', {
+            'date': start.strftime(activities.DATE_FORMAT),
+            'seen': [json.dumps(activities.compact(first), sort_keys=True)]})
+        self.client.iter_deliveries.return_value = iter(
+            [first, second, undated])
+        records = []
+        self.assertEqual(export.deliveries(records.append), 2)
+        self.client.iter_deliveries.assert_called_with(
+            start=start - timedelta(seconds=1), status=None)
+        self.assertEqual([x['id'] for x in records], ['2', '3'])
+
+    def test_cursor_is_saved_as_the_export_progresses(self):
+        start = datetime.utcnow().replace(microsecond=0) - timedelta(hours=2)
+        later = start + timedelta(hours=1)
+
+        def read(since, types=None):
+            yield self._activity(start, 'a')
+            yield self._activity(later, 'b')
+            raise client.BrontoError('Timed out')
+        self.client.iter_recent_outbound_activities.side_effect = read
+        export = activities.ActivityExport(self.client, self.state_path,
+                                           save_every=1)
+        records = []
+        saved = []
+        save_cursor = export._save_cursor
+        export._save_cursor = lambda stream, cursor: (
+            saved.append(cursor['date']), save_cursor(stream, cursor))
+        with self.assertRaises(client.BrontoError):
+            export.outbound(records.append)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(saved[0], start.strftime(activities.DATE_FORMAT))
+        self.assertEqual(export._load_state()['outbound']['date'],
+                         later.strftime(activities.DATE_FORMAT))
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'outbox.db')
+        self.client = mock.Mock()
+        self.client._validator.side_effect = lambda type_name, name, \
+            required=(): validation.RecordValidator(
+                name, ['id', 'email', 'fields', 'orderDate', 'messageId'],
+                checks={'email': validation._is_email})
+        self.client.get_fields.return_value = [mock.Mock()]
+        self.client.get_fields.return_value[0].name = 'firstname'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _response(self, *errors):
+        return mock.Mock(results=[
+            mock.Mock(isError=bool(x), errorCode=x, errorString='Invalid')
+            for x in errors])
+
+    def test_drain_sends_batches_and_keeps_rejected_records(self):
+        box = outbox.Outbox(self.path, batch_size=2)
+        box.put_many('contacts', [{'email': 'a@example.com'},
+                                  {'email': 'b@example.com'},
+                                  {'email': 'c@example.com'}])
+        self.client.add_or_update_contacts.side_effect = [
+            client.BrontoError('Partial', self._response(None, 303)),
+            self._response(None)]
+        self.assertEqual(box.drain(self.client), (2, 1))
+        self.assertEqual(self.client.add_or_update_contacts.call_args_list, [
+            mock.call([{'email': 'a@example.com'}, {'email': 'b@example.com'}]),
+            mock.call([{'email': 'c@example.com'}])])
+        self.assertEqual(box.pending(), 0)
+        self.assertEqual([x[2:] for x in box.failed()],
+                         [({'email': 'b@example.com'}, '303: Invalid')])
+
+    def test_invalid_records_fail_alone(self):
+        box = outbox.Outbox(self.path)
+        box.put_many('contacts', [{'email': 'a@example.com'},
+                                  {'email': 'not-an-email'},
+                                  {'email': 'c@example.com',
+                                   'fields': {'nickname': 'C'}}])
+        self.client.add_or_update_contacts.return_value = \
+            self._response(None)
+        self.assertEqual(box.drain(self.client), (1, 2))
+        self.client.add_or_update_contacts.assert_called_once_with(
+            [{'email': 'a@example.com'}])
+        self.assertEqual([x[3] for x in box.failed()], [
+            "Invalid contact email: 'not-an-email'",
+            'Invalid contactField: nickname'])
+
+    def test_failed_batches_are_retried_later(self):
+        box = outbox.Outbox(self.path, max_attempts=2, retry_delay=0)
+        box.put('orders', {'id': 'x', 'orderDate': datetime(2015, 1, 2)})
+        self.client.add_orders.side_effect = client.BrontoError('Timed out')
+        self.assertEqual(box.drain(self.client), (0, 0))
+        self.assertEqual(box.pending(), 1)
+        self.assertEqual(box.drain(self.client), (0, 0))
+        self.assertEqual(box.pending(), 0)
+        self.assertEqual([x[2:] for x in box.failed()],
+                         [({'id': 'x', 'orderDate': '2015-01-02T00:00:00+00:00'},
+                           'Timed out')])
+        box.retry_failed()
+        self.client.add_orders.side_effect = None
+        self.client.add_orders.return_value = self._response(None)
+        self.assertEqual(box.drain(self.client), (1, 0))
+
+    def test_open_circuit_does_not_use_attempts(self):
+        box = outbox.Outbox(self.path, max_attempts=1, retry_delay=0)
+        box.put('orders', {'id': 'x'})
+        self.client.add_orders.side_effect = dispatch.CircuitOpenError(
+            'Bronto keeps failing')
+        self.assertEqual(box.drain(self.client), (0, 0))
+        self.assertEqual(box.pending(), 1)
+        self.assertEqual(list(box.failed()), [])
+
+    def test_start_drains_with_a_clone(self):
+        box = outbox.Outbox(self.path)
+        drained = threading.Event()
+        worker = self.client.clone.return_value
+        worker._validator.side_effect = self.client._validator.side_effect
+        worker.add_orders.side_effect = lambda orders: (
+            drained.set(), self._response(None))[1]
+        box.put('orders', {'id': 'x'})
+        box.start(self.client, interval=0.01)
+        try:
+            self.assertTrue(drained.wait(5))
+        finally:
+            box.stop()
+        self.assertFalse(self.client.add_orders.called)
+
+    def test_records_of_a_crashed_drainer_are_sent_again(self):
+        box = outbox.Outbox(self.path, lease=0)
+        box.put('deliveries', {'messageId': 'x'})
+        self.assertEqual(len(box._claim('deliveries')), 1)
+        box.close()
+        box = outbox.Outbox(self.path)
+        self.client.add_deliveries.return_value = self._response(None)
+        self.assertEqual(box.drain(self.client), (1, 0))
+
+
+class ContactQueryTest(unittest.TestCase):
+
+    def test_compile(self):
+        factory = mock.Mock()
+        factory.create.side_effect = lambda name: mock.Mock(name=name)
+        contact_query = (query.ContactQuery('OR')
+                         .email('StartsWith', 'joey')
+                         .status(['active', 'onboarding'])
+                         .modified('After', datetime(2015, 1, 1)))
+        contact_filter = contact_query.compile(factory)
+        self.assertEqual(len(contact_filter.email), 1)
+        self.assertEqual(contact_filter.email[0].value, 'joey')
+        self.assertEqual(contact_filter.status, ['active', 'onboarding'])
+        self.assertEqual(contact_filter.modified[0].value,
+                         '2015-01-01T00:00:00+00:00')
+
+    def test_invalid_operator(self):
+        with self.assertRaises(ValueError):
+            query.ContactQuery().email('Like', 'joey')
+
+    def test_match_fields(self):
+        contact_query = query.ContactQuery().field('firstname', 'Test')
+        contact = mock.Mock(fields=[mock.Mock(fieldId='1', content='Test')])
+        self.assertTrue(contact_query.match(contact, {'1': 'firstname'}))
+        self.assertFalse(contact_query.match(contact, {'1': 'lastname'}))
+
+    def test_iter_contacts_ands_its_criteria(self):
+        bronto = client.Client('token')
+        bronto.find_contacts = mock.Mock(return_value=iter([]))
+        list(bronto.iter_contacts(modified_since=datetime(2015, 1, 1),
+                                  status='active', list_ids=['1', '2']))
+        contact_query = bronto.find_contacts.call_args[0][0]
+        self.assertEqual(contact_query.type, 'AND')
+        self.assertEqual(contact_query.criteria, {
+            'modified': [('After', datetime(2015, 1, 1))],
+            'status': ['active'], 'listId': ['1', '2']})
+
+    def test_find_contacts_reads_field_criteria(self):
+        bronto = client.Client('token')
+        bronto._client = mock.Mock()
+        bronto.get_fields = mock.Mock(
+            return_value=[mock.Mock(id='1'), mock.Mock(id='2')])
+        bronto.get_fields.return_value[0].name = 'firstname'
+        bronto.get_fields.return_value[1].name = 'lastname'
+        pages = [[mock.Mock(fields=[mock.Mock(fieldId='1', content='Test')]),
+                  mock.Mock(fields=[mock.Mock(fieldId='1', content='Joey')])],
+                 []]
+        bronto._read_contacts = mock.Mock(side_effect=pages)
+        contact_query = query.ContactQuery().field('firstname', 'Test')
+        found = list(bronto.find_contacts(contact_query))
+        self.assertEqual(found, [pages[0][0]])
+        self.assertEqual(bronto._read_contacts.call_args_list[0][0][2],
+                         ['firstname'])
+
+
+class DeliveryQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock(_cached_messages_by_id={'msg-id': None},
+                                _max_workers=None)
+        # Without a pool, batches are sent with a clone.
+        self.client.clone.return_value = self.client
+        self.client._submit.side_effect = lambda func, *args: \
+            self._submit(func, *args)
+        self.client.get_message.return_value = mock.Mock(id='msg-id')
+        self.client._validator.return_value = validation.RecordValidator(
+            'delivery', ['start', 'messageId', 'type', 'fromEmail', 'fromName',
+                         'replyEmail', 'recipients', 'fields'],
+            client.DELIVERY_REQUIRED_ATTRIBUTES,
+            checks={'fromEmail': validation._is_email})
+
+    def _submit(self, func, *args):
+        future = deliveries.Future()
+        future.set_result(func(self.client, *args))
+        return future
+
+    def test_send_coalesces(self):
+        error = mock.Mock(isError=True, errorCode=303, errorString='Bad')
+        response = mock.Mock(results=[mock.Mock(isError=False, id='1'), error])
+        self.client.add_deliveries.side_effect = client.BrontoError('', response)
+        with deliveries.DeliveryQueue(self.client, linger=1,
+                                      fromEmail='me@domain.com',
+                                      fromName='Me') as queue:
+            first = queue.send('bronto_api_test', ['contact-1'],
+                               {'message': 'Hi'})
+            second = queue.send('msg-id', [{'type': 'contact', 'id': '2'}])
+        self.assertEqual(first.result().id, '1')
+        self.assertRaises(client.BrontoError, second.result)
+        self.client.clone.assert_called_once_with()
+        self.client.get_message.assert_called_once_with('bronto_api_test')
+        sent = self.client.add_deliveries.call_args[0][0]
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(sent[0]['messageId'], 'msg-id')
+        self.assertEqual(sent[0]['recipients'],
+                         [{'type': 'contact', 'id': 'contact-1'}])
+        self.assertEqual(sent[0]['fields'],
+                         [{'name': 'message', 'type': 'html', 'content': 'Hi'}])
+        self.assertEqual(sent[1]['fromEmail'], 'me@domain.com')
+
+    def test_every_future_is_resolved(self):
+        self.client.add_deliveries.return_value = mock.Mock(
+            results=[mock.Mock(isError=False, id='1')])
+        with deliveries.DeliveryQueue(self.client, linger=1,
+                                      fromEmail='me@domain.com',
+                                      fromName='Me') as queue:
+            first = queue.send('msg-id', ['contact-1'])
+            second = queue.send('msg-id', ['contact-2'])
+        self.assertEqual(first.result(timeout=1).id, '1')
+        self.assertRaises(client.BrontoError, second.result, timeout=1)
+
+        self.client._submit.side_effect = RuntimeError('Shut down')
+        with deliveries.DeliveryQueue(self.client, linger=0,
+                                      fromEmail='me@domain.com',
+                                      fromName='Me') as queue:
+            first = queue.send('msg-id', ['contact-1'])
+            self.assertRaises(RuntimeError, first.result, timeout=1)
+            second = queue.send('msg-id', ['contact-2'])
+            self.assertRaises(RuntimeError, second.result, timeout=1)
+
+    def test_send_fails_invalid_delivery_alone(self):
+        response = mock.Mock(results=[mock.Mock(isError=False, id='1')])
+        self.client.add_deliveries.return_value = response
+        with deliveries.DeliveryQueue(self.client, linger=1,
+                                      fromEmail='me@domain.com',
+                                      fromName='Me') as queue:
+            first = queue.send('msg-id', ['contact-1'])
+            second = queue.send('msg-id', ['contact-2'],
+                                fromEmail='not-an-email')
+        self.assertEqual(first.result().id, '1')
+        self.assertRaises(ValueError, second.result)
+        sent = self.client.add_deliveries.call_args[0][0]
+        self.assertEqual([x['recipients'][0]['id'] for x in sent],
+                         ['contact-1'])
+
+
+class CommandLineTest(unittest.TestCase):
+
+    def test_parser(self):
+        args = cli.build_parser().parse_args(
+            ['--token', 'token', 'list', 'add', 'my_list', 'emails.csv'])
+        self.assertEqual((args.command, args.action, args.list),
+                         ('list', 'add', 'my_list'))
+
+    def test_run_reports_row_errors(self):
+        response = mock.Mock(results=[mock.Mock(isError=False),
+                                      mock.Mock(isError=True, errorCode=303,
+                                                errorString='Invalid')])
+        with mock.patch.object(cli, '_client') as worker_client:
+            worker_client.add_or_update_contacts.side_effect = \
+                client.BrontoError('', response)
+            count, errors = cli._run(('import', [(1, {'email': 'a@x.com'}),
+                                                 (2, {'email': 'b'})], None))
+        self.assertEqual(count, 2)
+        self.assertEqual(errors, [(2, '303: Invalid')])
+
+    def test_failed_login_ends_the_job_at_once(self):
+        with mock.patch.object(cli, 'Client') as client_class, \
+                mock.patch.object(cli.multiprocessing, 'Pool') as pool:
+            client_class.return_value.login.side_effect = \
+                client.BrontoError('Invalid token')
+            with mock.patch.object(cli.sys, 'stderr', io.StringIO()):
+                self.assertEqual(cli.main(['--token', 'token', 'delete',
+                                           'contacts.csv']), 1)
+        self.assertFalse(pool.called)
+
+    def test_worker_login_errors_are_reported_per_batch(self):
+        with mock.patch.object(cli, '_client') as worker_client, \
+                mock.patch.object(cli, '_logged_in', False):
+            worker_client.login.side_effect = client.BrontoError('Down')
+            cli._init_worker('token')
+            count, errors = cli._run(('delete', [(1, 'a@x.com')], None))
+        self.assertEqual((count, errors), (1, [(1, 'Down')]))
+
+    def test_run_reports_other_errors_per_batch(self):
+        with mock.patch.object(cli, '_client') as worker_client:
+            worker_client.add_or_update_contacts.side_effect = \
+                socket.timeout('timed out')
+            count, errors = cli._run(('import', [(1, {'email': 'a@x.com'}),
+                                                 (2, {'email': 'b@x.com'})],
+                                      None))
+        self.assertEqual(count, 2)
+        self.assertEqual(errors, [(1, 'timed out'), (2, 'timed out')])
+
+    def test_export_reads_past_failed_pages(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'contacts.ndjson')
+        pages = {1: [{'id': '1'}], 2: socket.timeout('timed out'),
+                 3: [{'id': '3'}]}
+
+        def read_contacts(contact_filter, page_number):
+            page = pages.get(page_number, [])
+            if isinstance(page, Exception):
+                raise page
+            return page
+        pool = mock.Mock()
+        pool.apply_async.side_effect = lambda func, args: mock.Mock(
+            get=lambda: func(*args))
+        progress = mock.Mock()
+        args = cli.build_parser().parse_args(
+            ['--token', 'token', '--processes', '1', 'export', path])
+        with mock.patch.object(cli, '_client') as worker_client:
+            worker_client._read_contacts.side_effect = read_contacts
+            cli._export(args, pool, progress)
+        with open(path) as handle:
+            self.assertEqual([json.loads(x)['id'] for x in handle],
+                             ['1', '3'])
+        self.assertIn(mock.call(0, [(None, 'page 2: timed out')]),
+                      progress.update.call_args_list)
+
+
 if __name__ == '__main__':
     unittest.main()